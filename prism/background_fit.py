@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from datasets.encoded_data import EncodedData
+from fit_checkpoint import FitCheckpoint
+from prism import Prism, FitProgressSubscriber
+
+
+class BackgroundFit(FitProgressSubscriber):
+    """
+    Fit running in a background thread, so the caller (a user interface) stays responsive
+
+    Progress is passed through a queue at most once per interval (intermediate states are coalesced,
+    the last state of every class is always delivered), the caller reads it with forward().
+    The fit can be cancelled, it stops after the rule it is inducing and keeps the rules induced so far.
+    """
+
+    def __init__(self, prism: Prism, data: EncodedData, n_jobs: int = 1, interval: float = 0.1,
+                 checkpoint: FitCheckpoint = None):
+        self.prism = prism
+        self.data = data
+        self.n_jobs = n_jobs
+        self.checkpoint = checkpoint
+        self.interval = interval
+        self.events = queue.Queue()
+        self.error: Optional[BaseException] = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._completed = threading.Event()
+        self._thread = threading.Thread(target=self.__run, daemon=True)
+        self._pending_state: Optional[int] = None
+        self._last_sent = 0.0
+
+    def start(self) -> 'BackgroundFit':
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def completed(self) -> bool:
+        """
+        The fit induced rules of all classes, also if it was cancelled only after its last rule
+        """
+        return self._completed.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def result(self):
+        """
+        Rules of the fit (partial if it was cancelled), raises the error of the fit if it failed
+        """
+        self.wait()
+        if self.error is not None:
+            raise self.error
+        return self.prism.rules
+
+    def forward(self, subscriber: FitProgressSubscriber, timeout: float = 0) -> bool:
+        """
+        Pass the queued progress to the subscriber (waiting up to timeout for the first event),
+        returns True once the fit has finished and all its progress was passed
+        """
+        events: List[tuple] = []
+        try:
+            events.append(self.events.get(timeout=timeout) if timeout > 0 else self.events.get_nowait())
+            while True:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        finished = False
+        for kind, *args in events:
+            if kind == "class":
+                subscriber.update_class(*args)
+            elif kind == "progress":
+                subscriber.update_progress(*args)
+            else:
+                finished = True
+        return finished
+
+    def __run(self):
+        self.prism.subscribe(self)
+        try:
+            if self.prism.fit_encoded(self.data, self.n_jobs, cancel=self._cancel, checkpoint=self.checkpoint):
+                self._completed.set()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.prism.unsubscribe(self)
+            self.__flush()
+            self._done.set()
+            self.events.put(("done",))
+
+    def __flush(self):
+        if self._pending_state is not None:
+            self.events.put(("progress", self._pending_state))
+            self._pending_state = None
+            self._last_sent = time.monotonic()
+
+    def update_progress(self, state: int):
+        self._pending_state = state
+        if time.monotonic() - self._last_sent >= self.interval:
+            self.__flush()
+
+    def update_class(self, class_name: str, class_num: int, num_classes: int, total_num_it: int):
+        self.__flush()  # last state of the previous class
+        self.events.put(("class", class_name, class_num, num_classes, total_num_it))
@@ -0,0 +1,250 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List
+
+from datasets.columnar_store import plain_value
+from datasets.dataset import Dataset
+from datasets.datasets_manager import DatasetsManager
+from fit_checkpoint import FitCheckpoint
+from prism import Prism
+from streaming import StreamingClassifier
+
+
+CHECKPOINT_EVERY_RULES = 100
+
+
+def _init_worker():
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+
+def _summary(dataset: str, task: Callable[[], dict]) -> dict:
+    """
+    Result of the task for the dataset, with its status and duration, an error doesn't stop the other datasets
+    """
+    start = time.perf_counter()
+    try:
+        result = {"dataset": dataset, "status": "ok", **task()}
+    except Exception as e:
+        result = {"dataset": dataset, "status": "error", "error": f"{type(e).__name__}: {e}"}
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def fit_dataset(dirname: str, refit: bool = False, n_jobs: int = 1) -> dict:
+    """
+    Fit rules of the dataset and store them, rules already fitted on the same data are reused unless refit
+    """
+    def task():
+        dataset = Dataset.load_metadata(dirname)
+        prism = Prism()
+        if dataset.rules_available and not refit:
+            prism.load_model(dataset.load_model())
+            return {"name": dataset.name, "fitted": False, "rules": len(prism.rules)}
+        checkpoint = FitCheckpoint(dataset.checkpoint_dirname, every_rules=CHECKPOINT_EVERY_RULES)
+        prism.fit_encoded(dataset.encoded_train, n_jobs, checkpoint=checkpoint)
+        dataset.save_rules(prism.rules)
+        checkpoint.clear()
+        return {"name": dataset.name, "fitted": True, "rules": len(prism.rules)}
+    return _summary(os.path.basename(dirname), task)
+
+
+def evaluate_dataset(dirname: str, with_rules: bool = False) -> dict:
+    """
+    Metrics of the stored rules on the testing data, with precision and coverage of every rule if with_rules
+    """
+    def task():
+        dataset = Dataset.load_metadata(dirname)
+        if not dataset.rules_available:
+            raise ValueError(f"Dataset {dataset.name} has no rules for its current data, fit them first.")
+        prism = Prism()
+        prism.load_model(dataset.load_model())
+        result = {"name": dataset.name, "rules": len(prism.rules), **vars(dataset.evaluate_dataset(prism))}
+        if with_rules:
+            result["rules_eval"] = [{"rule": json.loads(r.rule.toJson()), "precision": r.precision,
+                                     "coverage": r.coverage} for r in dataset.evaluate_rules(prism)]
+        return result
+    return _summary(os.path.basename(dirname), task)
+
+
+def predict_file(dirname: str, source_filename: str, output_filename: str, chunk_size: int = 100_000) -> dict:
+    """
+    Write predictions of instances of the source file, metrics are included if it contains the target variable
+    """
+    def task():
+        dataset = Dataset.load_metadata(dirname)
+        if not dataset.rules_available:
+            raise ValueError(f"Dataset {dataset.name} has no rules for its current data, fit them first.")
+        prism = Prism()
+        prism.load_model(dataset.load_model())
+        evaluation = StreamingClassifier(prism, dataset, chunk_size).run(source_filename, output_filename)
+        return {"name": dataset.name, "input": source_filename, "output": output_filename,
+                **(vars(evaluation) if evaluation is not None else {})}
+    return _summary(os.path.basename(dirname), task)
+
+
+def memory_report(dirname: str, decode: bool = False) -> dict:
+    """
+    Memory footprint of the dataset (see Dataset.memory_report)
+    """
+    return _summary(os.path.basename(dirname), lambda: Dataset.load_metadata(dirname).memory_report(decode))
+
+
+def ingest_file(source_filename: str, y_name: str, name: str, top_dir: str, max_values: int = 5,
+                chunk_size: int = None, rules_file: str = None) -> dict:
+    """
+    Create a dataset from a CSV file
+    """
+    def task():
+        dataset = Dataset.create_from_file(source_filename, y_name, name, top_dir, rules_file, chunk_size, max_values)
+        return {"name": dataset.name, "directory": dataset.dirname, "source": source_filename,
+                "instances": dataset.num_inst, "attributes": dataset.num_att, "targets": dataset.num_targ}
+    return _summary(name.replace(' ', '_'), task)
+
+
+class BatchCli:
+    """
+    Non-interactive commands over the datasets of a directory, the datasets are processed concurrently
+    by a pool of worker processes, a JSON summary with a result per dataset is written at the end
+    """
+
+    def __init__(self, top_dir: str = "data", jobs: int = 1):
+        self.d_manager = DatasetsManager(top_dir)
+        self.jobs = jobs
+
+    def select(self, names: List[str], all_datasets: bool) -> List[str]:
+        """
+        Directories of the datasets given by name (or directory name), or of all datasets
+        """
+        if all_datasets:
+            return [d.dirname for d in self.d_manager.datasets_list]
+        by_name = {}
+        for d in self.d_manager.datasets_list:
+            by_name[d.name] = by_name[os.path.basename(d.dirname)] = d.dirname
+        missing = [name for name in names if name not in by_name]
+        if len(missing) > 0:
+            raise ValueError(f"Unknown datasets: {', '.join(missing)}")
+        return [by_name[name] for name in names]
+
+    def map(self, fn: Callable[..., dict], arguments: List[tuple]) -> List[dict]:
+        if self.jobs <= 1 or len(arguments) <= 1:
+            return [fn(*args) for args in arguments]
+        with ProcessPoolExecutor(min(self.jobs, len(arguments)), initializer=_init_worker) as executor:
+            futures = [executor.submit(fn, *args) for args in arguments]
+            return [f.result() for f in futures]
+
+    def fit(self, dirnames: List[str], refit: bool = False, fit_jobs: int = 1) -> List[dict]:
+        return self.map(fit_dataset, [(dirname, refit, fit_jobs) for dirname in dirnames])
+
+    def evaluate(self, dirnames: List[str], with_rules: bool = False) -> List[dict]:
+        return self.map(evaluate_dataset, [(dirname, with_rules) for dirname in dirnames])
+
+    def predict(self, dirnames: List[str], source_filename: str, output: str, chunk_size: int = 100_000) -> List[dict]:
+        """
+        output - file of the predictions if there is one dataset, otherwise directory of files named by datasets
+        """
+        if len(dirnames) == 1:
+            outputs = [output]
+        else:
+            os.makedirs(output, exist_ok=True)
+            outputs = [f"{output}/{os.path.basename(dirname)}.csv" for dirname in dirnames]
+        return self.map(predict_file, [(dirname, source_filename, out, chunk_size)
+                                       for dirname, out in zip(dirnames, outputs)])
+
+    def memory(self, dirnames: List[str], decode: bool = False) -> List[dict]:
+        return self.map(memory_report, [(dirname, decode) for dirname in dirnames])
+
+    def ingest(self, source_filenames: List[str], y_name: str, names: List[str] = None, max_values: int = 5,
+               chunk_size: int = None, rules_file: str = None) -> List[dict]:
+        if names is None:
+            names = [os.path.splitext(os.path.basename(filename))[0] for filename in source_filenames]
+        if len(names) != len(source_filenames):
+            raise ValueError("Give one name for every file.")
+        return self.map(ingest_file, [(filename, y_name, name, self.d_manager.top_dir, max_values, chunk_size,
+                                       rules_file) for filename, name in zip(source_filenames, names)])
+
+
+def _add_selection(parser: argparse.ArgumentParser):
+    parser.add_argument("datasets", nargs="*", help="names of the datasets")
+    parser.add_argument("--all", action="store_true", help="all datasets of the data directory")
+
+
+def parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--data-dir", default="data", help="directory of the datasets")
+    common.add_argument("--jobs", type=int, default=1, help="number of datasets processed concurrently")
+    common.add_argument("--output", help="write the JSON summary to this file instead of the standard output")
+
+    parser = argparse.ArgumentParser(description="Fit, evaluate and use PRISM rules of datasets without interaction.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fit = commands.add_parser("fit", parents=[common], help="fit and store rules of datasets")
+    _add_selection(fit)
+    fit.add_argument("--refit", action="store_true", help="fit again even if rules for the data are stored")
+    fit.add_argument("--fit-jobs", type=int, default=1, help="worker processes of the fit of one dataset")
+
+    evaluate = commands.add_parser("evaluate", parents=[common], help="evaluate stored rules on the testing data")
+    _add_selection(evaluate)
+    evaluate.add_argument("--rules", action="store_true", help="include precision and coverage of every rule")
+
+    predict = commands.add_parser("predict", parents=[common], help="classify instances of a CSV file")
+    _add_selection(predict)
+    predict.add_argument("--input", required=True, help="CSV file with the instances (raw values)")
+    predict.add_argument("--predictions", required=True,
+                         help="CSV file of the predictions, a directory if more datasets are selected")
+    predict.add_argument("--chunk-size", type=int, default=100_000)
+
+    memory = commands.add_parser("memory", parents=[common], help="report memory footprint of datasets")
+    _add_selection(memory)
+    memory.add_argument("--decode", action="store_true", help="include the decoded training and testing frames")
+
+    ingest = commands.add_parser("ingest", parents=[common], help="create datasets from CSV files")
+    ingest.add_argument("files", nargs="+", help="CSV files, one dataset per file")
+    ingest.add_argument("--target", required=True, help="name of the target variable")
+    ingest.add_argument("--names", nargs="+", help="names of the datasets (by default the file names)")
+    ingest.add_argument("--max-values", type=int, default=5, help="numerical attributes with more values are binned")
+    ingest.add_argument("--chunk-size", type=int, help="preprocess the files in chunks of this many rows")
+    ingest.add_argument("--rules-file", help="JSON file with rules for the datasets")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = parser().parse_args(argv)
+    _init_worker()
+    cli = BatchCli(args.data_dir, args.jobs)
+    try:
+        if args.command == "ingest":
+            results = cli.ingest(args.files, args.target, args.names, args.max_values, args.chunk_size,
+                                 args.rules_file)
+        else:
+            if not args.all and len(args.datasets) == 0:
+                raise ValueError("Select datasets by name or use --all.")
+            dirnames = cli.select(args.datasets, args.all)
+            if args.command == "fit":
+                results = cli.fit(dirnames, args.refit, args.fit_jobs)
+            elif args.command == "evaluate":
+                results = cli.evaluate(dirnames, args.rules)
+            elif args.command == "memory":
+                results = cli.memory(dirnames, args.decode)
+            else:
+                results = cli.predict(dirnames, args.input, args.predictions, args.chunk_size)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    summary = json.dumps({"command": args.command, "results": results}, indent=2, default=plain_value)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(summary)
+    else:
+        print(summary)
+    return 0 if all(r["status"] == "ok" for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
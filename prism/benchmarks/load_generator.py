@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+# run by its path (python benchmarks/load_generator.py), modules of the application are one level up
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datasets.dataset import Dataset
+from prediction_service import PredictionService
+
+
+class LoadGenerator:
+    """
+    Concurrent clients sending prediction requests to a PredictionService over keep-alive connections
+
+    Every client sends its requests one after another, rows are taken from the given instances in turn.
+    batch_size 1 uses the single-row endpoint (micro-batched by the service), larger sizes /predict_batch.
+    """
+
+    def __init__(self, rows: List[dict], host: str = "127.0.0.1", port: int = 8000, concurrency: int = 32,
+                 num_requests: int = 10_000, batch_size: int = 1):
+        self.rows = rows
+        self.host = host
+        self.port = port
+        self.concurrency = concurrency
+        self.num_requests = num_requests
+        self.batch_size = batch_size
+        self._next = 0
+
+    @classmethod
+    def rows_from_file(cls, filename: str, drop: List[str] = ()) -> List[dict]:
+        """
+        Instances of a CSV file with raw values (missing values as null)
+        """
+        df = pd.read_csv(filename).drop(columns=list(drop), errors='ignore')
+        return [{att: (None if pd.isna(val) else val) for att, val in row.items()}
+                for row in df.to_dict(orient="records")]
+
+    def __request_body(self) -> bytes:
+        if self.batch_size == 1:
+            payload = self.rows[self._next % len(self.rows)]
+        else:
+            payload = {"rows": [self.rows[(self._next + i) % len(self.rows)] for i in range(self.batch_size)]}
+        self._next += self.batch_size
+        return json.dumps(payload).encode("utf-8")
+
+    @staticmethod
+    async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                      body: bytes = b""):
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await reader.readexactly(length))
+
+    async def __client(self, num_requests: int, latencies: list, errors: list):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        path = "/predict" if self.batch_size == 1 else "/predict_batch"
+        try:
+            for _ in range(num_requests):
+                body = self.__request_body()
+                start = time.perf_counter()
+                status, _ = await self.request(reader, writer, "POST", path, body)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors.append(status)
+        finally:
+            writer.close()
+
+    async def run(self) -> dict:
+        """
+        Client-side throughput and latency of the run, with the service's own counters
+        """
+        latencies, errors = [], []
+        per_client = [self.num_requests // self.concurrency + (i < self.num_requests % self.concurrency)
+                      for i in range(self.concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(self.__client(n, latencies, errors) for n in per_client if n > 0))
+        elapsed = time.perf_counter() - start
+
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            _, service_metrics = await self.request(reader, writer, "GET", "/metrics")
+        finally:
+            writer.close()
+        latencies_ms = np.array(latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]).tolist() if len(latencies) > 0 else [0, 0, 0]
+        return {"requests": len(latencies), "rows": len(latencies) * self.batch_size, "errors": len(errors),
+                "seconds": elapsed, "requests_per_second": len(latencies) / elapsed,
+                "rows_per_second": len(latencies) * self.batch_size / elapsed,
+                "latency_ms": {"p50": p50, "p95": p95, "p99": p99,
+                               "max": float(latencies_ms.max()) if len(latencies) > 0 else 0},
+                "service": service_metrics}
+
+
+async def _run_with_service(generator: LoadGenerator, service: Optional[PredictionService]) -> dict:
+    if service is not None:
+        await service.start()
+        generator.port = service.port
+    try:
+        return await generator.run()
+    finally:
+        if service is not None:
+            await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the prediction service. "
+                                                 "Run from the prism directory as python -m benchmarks.load_generator "
+                                                 "(or python benchmarks/load_generator.py).")
+    parser.add_argument("file", help="CSV file with instances to send (raw values, as the dataset's source file)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--serve", metavar="DATASET",
+                        help="start a service for this dataset directory in-process instead of using a running one")
+    parser.add_argument("--drop", nargs="*", default=[], help="columns of the file not to send (e.g. the target)")
+    parser.add_argument("--concurrency", type=int, default=32, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=1, help="rows per request (1 = single-row endpoint)")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="micro-batch size of the in-process service")
+    parser.add_argument("--max-delay", type=float, default=2.0,
+                        help="milliseconds a micro-batch of the in-process service waits for more rows")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.CRITICAL)
+    generator = LoadGenerator(LoadGenerator.rows_from_file(args.file, args.drop), args.host, args.port,
+                              args.concurrency, args.requests, args.batch_size)
+    service = None
+    if args.serve is not None:
+        service = PredictionService.from_dataset(Dataset.load_metadata(args.serve), host=args.host, port=0,
+                                                 max_batch_size=args.max_batch_size, max_delay=args.max_delay / 1000)
+    print(json.dumps(asyncio.run(_run_with_service(generator, service)), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
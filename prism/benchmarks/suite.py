@@ -0,0 +1,209 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+import numpy as np
+
+# run by its path (python benchmarks/suite.py), modules of the application are one level up
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SyntheticDataset
+from datasets.dataset import Dataset
+from datasets.preprocessing import DataPreprocessor
+from prism import Prism
+
+
+class BenchmarkSuite:
+    """
+    Time and peak memory of the main paths (fit, classification, evaluation, loading, binning)
+    on synthetic datasets of a scaling grid
+
+    Time is the best of repeat runs, peak memory is measured by tracemalloc in one extra run
+    (memory allocated during the run above what was allocated before it, numpy arrays included).
+    """
+
+    VERSION = 1
+    BENCHMARKS = ("fit", "classify", "evaluate_dataset", "evaluate_rules", "load_from_storage", "apply_binning")
+
+    def __init__(self, grid: List[SyntheticDataset], repeat: int = 3, benchmarks=BENCHMARKS):
+        self.grid = grid
+        self.repeat = repeat
+        self.benchmarks = benchmarks
+
+    @staticmethod
+    def measure(fn: Callable, setup: Callable = None, repeat: int = 3):
+        """
+        Best time of fn over repeat runs and its peak memory, setup is called before every run (not measured)
+        """
+        times = []
+        for _ in range(repeat):
+            arg = setup() if setup is not None else None
+            start = time.perf_counter()
+            fn(arg)
+            times.append(time.perf_counter() - start)
+        arg = setup() if setup is not None else None
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            fn(arg)
+            peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+        return min(times), peak
+
+    def run(self) -> List[dict]:
+        results = []
+        for synthetic in self.grid:
+            print(f"Benchmark: {synthetic.describe()}", file=sys.stderr)
+            results.extend(self.__run_one(synthetic))
+        return results
+
+    def __run_one(self, synthetic: SyntheticDataset) -> List[dict]:
+        df = synthetic.generate()
+        y_name = synthetic.y_name
+        np.random.seed(synthetic.seed)  # split of DataPreprocessor
+
+        def preprocessor(_=None):
+            return DataPreprocessor(df, y_name)
+
+        prep = preprocessor()
+        prep.apply_binning()
+        train, test = prep.get_train_test()
+        X_train, y_train = train.drop(y_name, axis=1), train[y_name]
+        X_test, y_test = test.drop(y_name, axis=1), test[y_name]
+
+        def fit(_=None):
+            random.seed(0)  # same tie-breaking, so every run does the same work
+            prism = Prism()
+            prism.fit(X_train, y_train)
+            return prism
+
+        def load(_=None):
+            dataset = Dataset.load_from_storage(dirname)
+            return dataset.train, dataset.test  # decoded from the memory-mapped storage
+
+        fitted = fit()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            dirname = self.__store(tmp_dir, df, y_name)
+            cases = {
+                "fit": (fit, None),
+                "classify": (lambda _: fitted.classify(X_test), None),
+                "evaluate_dataset": (lambda _: fitted.evaluate_dataset(X_test, y_test), None),
+                "evaluate_rules": (lambda _: fitted.evaluate_rules(X_train, y_train), None),
+                "load_from_storage": (load, None),
+                "apply_binning": (lambda p: p.apply_binning(), preprocessor),
+            }
+            results = []
+            for name in self.benchmarks:
+                fn, setup = cases[name]
+                seconds, peak = self.measure(fn, setup, self.repeat)
+                results.append({"benchmark": name, **synthetic.describe(), "rules": len(fitted.rules),
+                                "time": seconds, "peak_memory": peak})
+        finally:
+            shutil.rmtree(tmp_dir)
+        return results
+
+    @staticmethod
+    def __store(tmp_dir: str, df, y_name: str) -> str:
+        df.to_csv(f"{tmp_dir}/source.csv", index=False)
+        return Dataset.create_from_file(f"{tmp_dir}/source.csv", y_name, "dataset", tmp_dir).dirname
+
+    @classmethod
+    def save(cls, results: List[dict], filename: str):
+        with open(filename, "w") as f:
+            json.dump({"version": cls.VERSION, "results": results}, f, indent=1)
+
+    @classmethod
+    def load(cls, filename: str) -> List[dict]:
+        with open(filename, "r") as f:
+            return json.load(f)["results"]
+
+    @staticmethod
+    def key(result: dict) -> tuple:
+        return tuple(result[k] for k in ("benchmark", "rows", "attributes", "cardinality", "classes", "noise",
+                                         "numeric"))
+
+    @classmethod
+    def compare(cls, results: List[dict], baseline: List[dict], tolerance: float = 0.2) -> List[dict]:
+        """
+        Results with their baseline values, a result regressed if its time or peak memory
+        exceeds the baseline by more than the tolerance (a fraction of the baseline)
+        """
+        by_key = {cls.key(r): r for r in baseline}
+        comparison = []
+        for r in results:
+            base = by_key.get(cls.key(r))
+            if base is None:
+                continue
+            time_ratio = r["time"] / base["time"] if base["time"] > 0 else 1.0
+            memory_ratio = r["peak_memory"] / base["peak_memory"] if base["peak_memory"] > 0 else 1.0
+            comparison.append({**r, "base_time": base["time"], "base_peak_memory": base["peak_memory"],
+                               "time_ratio": time_ratio, "memory_ratio": memory_ratio,
+                               "regression": time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance})
+        return comparison
+
+
+def _grid(args) -> List[SyntheticDataset]:
+    return [SyntheticDataset(rows, attributes, cardinality, classes, args.noise, num_numeric=args.numeric,
+                             seed=args.seed)
+            for rows, attributes, cardinality, classes in itertools.product(args.rows, args.attributes,
+                                                                            args.cardinality, args.classes)]
+
+
+def _print_table(results: List[dict], comparison: Optional[List[dict]]):
+    header = f"{'benchmark':<18} {'rows':>8} {'att':>4} {'card':>4} {'cls':>4} {'time [s]':>10} {'peak [MB]':>10}"
+    if comparison is not None:
+        header += f" {'time x':>7} {'mem x':>7}"
+    print(header)
+    for r in comparison if comparison is not None else results:
+        line = f"{r['benchmark']:<18} {r['rows']:>8} {r['attributes']:>4} {r['cardinality']:>4} {r['classes']:>4} " \
+               f"{r['time']:>10.4f} {r['peak_memory'] / 2 ** 20:>10.2f}"
+        if comparison is not None:
+            line += f" {r['time_ratio']:>7.2f} {r['memory_ratio']:>7.2f}" + ("  REGRESSION" if r["regression"] else "")
+        print(line)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks of PRISM on synthetic datasets. "
+                                                 "Run from the prism directory as python -m benchmarks.suite "
+                                                 "(or python benchmarks/suite.py).")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--attributes", type=int, nargs="+", default=[5, 10])
+    parser.add_argument("--cardinality", type=int, nargs="+", default=[5])
+    parser.add_argument("--classes", type=int, nargs="+", default=[3])
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--numeric", type=int, default=1, help="number of numeric (binned) attributes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--benchmarks", nargs="+", choices=BenchmarkSuite.BENCHMARKS,
+                        default=list(BenchmarkSuite.BENCHMARKS))
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare results with a JSON file written by --output")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown or memory growth against the baseline (fraction)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.CRITICAL)
+    results = BenchmarkSuite(_grid(args), args.repeat, args.benchmarks).run()
+    if args.output is not None:
+        BenchmarkSuite.save(results, args.output)
+    comparison = None
+    if args.baseline is not None:
+        comparison = BenchmarkSuite.compare(results, BenchmarkSuite.load(args.baseline), args.tolerance)
+    _print_table(results, comparison)
+    return 1 if comparison is not None and any(r["regression"] for r in comparison) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class SyntheticDataset:
+    """
+    Generator of categorical datasets with a known structure, for benchmarks
+
+    The class of an instance is given by the values of the first num_relevant attributes (so there are rules
+    to be found), the other attributes are random. A noise fraction of instances gets a random class instead.
+    num_numeric attributes are drawn from a normal distribution instead, so they go through binning.
+    """
+
+    def __init__(self, num_rows: int, num_attributes: int, cardinality: int = 5, num_classes: int = 3,
+                 noise: float = 0.0, num_relevant: int = 2, num_numeric: int = 0, seed: Optional[int] = 0):
+        self.num_rows = num_rows
+        self.num_attributes = num_attributes
+        self.cardinality = cardinality
+        self.num_classes = num_classes
+        self.noise = noise
+        self.num_relevant = min(num_relevant, num_attributes)
+        self.num_numeric = min(num_numeric, num_attributes - self.num_relevant)
+        self.seed = seed
+
+    y_name = "class"
+
+    def generate(self) -> pd.DataFrame:
+        rng = np.random.default_rng(self.seed)
+        codes = rng.integers(0, self.cardinality, size=(self.num_rows, self.num_attributes))
+        # class of every combination of values of the relevant attributes
+        combination = np.zeros(self.num_rows, dtype=np.int64)
+        for j in range(self.num_relevant):
+            combination = combination * self.cardinality + codes[:, j]
+        class_of = rng.integers(0, self.num_classes, size=self.cardinality ** self.num_relevant)
+        y = class_of[combination]
+        noisy = rng.random(self.num_rows) < self.noise
+        y[noisy] = rng.integers(0, self.num_classes, size=int(noisy.sum()))
+
+        columns = {}
+        for j in range(self.num_attributes):
+            name = f"a{j}"
+            if self.num_relevant <= j < self.num_relevant + self.num_numeric:
+                columns[name] = rng.normal(size=self.num_rows).round(3)
+            else:
+                columns[name] = np.char.add("v", codes[:, j].astype(str)).astype(object)
+        columns[self.y_name] = np.char.add("c", y.astype(str)).astype(object)
+        return pd.DataFrame(columns)
+
+    def to_csv(self, filename: str):
+        self.generate().to_csv(filename, index=False)
+
+    def describe(self) -> dict:
+        return {"rows": self.num_rows, "attributes": self.num_attributes, "cardinality": self.cardinality,
+                "classes": self.num_classes, "noise": self.noise, "numeric": self.num_numeric}
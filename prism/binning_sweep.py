@@ -0,0 +1,81 @@
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from datasets.encoded_data import EncodedData
+from datasets.preprocessing import BinningCache
+from prism import Prism
+
+
+class SweepResult:
+    def __init__(self, max_values: int, accuracy_all: float, accuracy_classified: float, coverage: float,
+                 num_rules: int, fit_time: float, num_binned: int):
+        self.max_values = max_values
+        self.accuracy_all = accuracy_all
+        self.accuracy_classified = accuracy_classified
+        self.coverage = coverage
+        self.num_rules = num_rules
+        self.fit_time = fit_time  # [s]
+        self.num_binned = num_binned  # number of binned attributes
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def _run_setting(cache: BinningCache, max_values: int, seed: int) -> SweepResult:
+    train, test, binning_info, _ = cache.bin(max_values)
+    data = EncodedData.from_frame(train.drop(cache.y_name, axis=1), train[cache.y_name])
+    random.seed(seed)
+    prism = Prism()
+    start = time.perf_counter()
+    prism.fit_encoded(data, classes=train[cache.y_name].unique())  # classes in the same order as Prism.fit
+    fit_time = time.perf_counter() - start
+    evaluation = prism.evaluate_dataset(test.drop(cache.y_name, axis=1), test[cache.y_name])
+    return SweepResult(max_values, evaluation.accuracy_all, evaluation.accuracy_classified, evaluation.coverage,
+                       len(prism.rules), fit_time, len(binning_info))
+
+
+_worker_cache: Optional[BinningCache] = None
+
+
+def _init_sweep_worker(cache: BinningCache):
+    global _worker_cache
+    _worker_cache = cache
+
+
+def _sweep_worker(max_values: int, seed: int) -> SweepResult:
+    return _run_setting(_worker_cache, max_values, seed)
+
+
+class BinningSweep:
+    """
+    Fit and evaluation of PRISM for every max_values setting of the binning of numerical attributes
+
+    The source file is read and split once, every setting only bins the cached data again,
+    settings are run in parallel processes (each process receives the cache once)
+    """
+
+    def __init__(self, cache: BinningCache, grid: List[int] = (2, 3, 5, 8, 12), n_jobs: int = 1, seed: int = None):
+        self.cache = cache
+        self.grid = list(grid)
+        self.n_jobs = n_jobs
+        self.seed = seed
+
+    @classmethod
+    def from_file(cls, source_filename: str, y_name: str, grid: List[int] = (2, 3, 5, 8, 12), n_jobs: int = 1,
+                  seed: int = None) -> 'BinningSweep':
+        return cls(BinningCache.from_file(source_filename, y_name, seed), grid, n_jobs, seed)
+
+    def run(self) -> List[SweepResult]:
+        seed = self.seed if self.seed is not None else random.getrandbits(32)  # same tie-breaking for every setting
+        if self.n_jobs <= 1:
+            return [_run_setting(self.cache, max_values, seed) for max_values in self.grid]
+        with ProcessPoolExecutor(min(self.n_jobs, len(self.grid)), initializer=_init_sweep_worker,
+                                 initargs=(self.cache,)) as executor:
+            futures = [executor.submit(_sweep_worker, max_values, seed) for max_values in self.grid]
+            return [f.result() for f in futures]
+
+    @staticmethod
+    def best(results: List[SweepResult], metric: str = "accuracy_all") -> SweepResult:
+        return max(results, key=lambda r: getattr(r, metric))
@@ -0,0 +1,126 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from sklearn.model_selection import KFold, StratifiedKFold
+
+from datasets.coverage_index import CoverageIndex, EncodedRows, pack
+from datasets.dataset_eval import DatasetEval
+from datasets.encoded_data import EncodedData, SharedEncodedData
+from prism import Prism
+
+
+class FoldResult:
+    def __init__(self, fold: int, evaluation: DatasetEval, num_rules: int, mean_rule_length: float,
+                 num_train: int, num_test: int):
+        self.fold = fold
+        self.evaluation = evaluation
+        self.num_rules = num_rules
+        self.mean_rule_length = mean_rule_length  # mean number of operands of a rule
+        self.num_train = num_train
+        self.num_test = num_test
+
+    def to_dict(self) -> dict:
+        return {"fold": self.fold, **vars(self.evaluation), "num_rules": self.num_rules,
+                "mean_rule_length": self.mean_rule_length, "num_train": self.num_train, "num_test": self.num_test}
+
+
+class CrossValidationResult:
+    def __init__(self, folds: List[FoldResult]):
+        self.folds = folds
+
+    def __metric(self, name: str) -> np.ndarray:
+        return np.array([getattr(f.evaluation, name) for f in self.folds])
+
+    @property
+    def mean(self) -> DatasetEval:
+        return DatasetEval(*(float(self.__metric(m).mean()) for m in ("accuracy_all", "accuracy_classified", "coverage")))
+
+    @property
+    def std(self) -> DatasetEval:
+        return DatasetEval(*(float(self.__metric(m).std()) for m in ("accuracy_all", "accuracy_classified", "coverage")))
+
+    @property
+    def rule_counts(self) -> dict:
+        counts = np.array([f.num_rules for f in self.folds])
+        return {"mean": float(counts.mean()), "std": float(counts.std()), "min": int(counts.min()),
+                "max": int(counts.max())}
+
+    def to_dict(self) -> dict:
+        return {"folds": [f.to_dict() for f in self.folds], "mean": vars(self.mean), "std": vars(self.std),
+                "rule_counts": self.rule_counts}
+
+
+def _splits(data: EncodedData, n_splits: int, stratified: bool, seed: Optional[int]) -> list:
+    if stratified:
+        splitter = StratifiedKFold(n_splits, shuffle=True, random_state=seed)
+    else:
+        splitter = KFold(n_splits, shuffle=True, random_state=seed)
+    return list(splitter.split(np.zeros(len(data)), data.y))
+
+
+def _run_fold(index: CoverageIndex, fold: int, train_rows: np.ndarray, test_rows: np.ndarray,
+              seed: int) -> FoldResult:
+    """
+    Fit on the training instances of the fold given as a bitmap over the index of all data (no copy of them),
+    only the testing instances are decoded for the evaluation
+    """
+    random.seed(seed)
+    train_mask = np.zeros(index.size, dtype=bool)
+    train_mask[train_rows] = True
+    prism = Prism()
+    prism.fit_encoded(index.data, rows=EncodedRows(index, pack(train_mask)))
+    X_test, y_test = index.data.subset(test_rows).to_frame()
+    evaluation = prism.evaluate_dataset(X_test, y_test)
+    lengths = [len(r.operands) for r in prism.rules]
+    return FoldResult(fold, evaluation, len(prism.rules), float(np.mean(lengths)) if len(lengths) > 0 else 0,
+                      len(train_rows), len(test_rows))
+
+
+_worker_index: Optional[CoverageIndex] = None
+_worker_splits = None
+
+
+def _init_fold_worker(spec, n_splits: int, stratified: bool, seed: Optional[int]):
+    global _worker_index, _worker_splits
+    data = SharedEncodedData.attach(spec)
+    _worker_index = CoverageIndex(data)  # one index for all folds of the worker
+    _worker_splits = _splits(data, n_splits, stratified, seed)  # same folds as in the main process
+
+
+def _fold_worker(fold: int, seed: int) -> FoldResult:
+    train_rows, test_rows = _worker_splits[fold]
+    return _run_fold(_worker_index, fold, train_rows, test_rows, seed)
+
+
+class CrossValidation:
+    """
+    k-fold cross-validation of PRISM on encoded data, folds are fitted and evaluated in parallel processes
+    which attach to one copy of the data in shared memory, folds are fitted on bitmaps of their training instances
+    over one coverage index of a worker, so the data aren't copied for a fold
+
+    stratified  - keep the proportions of classes in every fold
+    seed        - seed of the split into folds and of the tie-breaking of the fits
+    """
+
+    def __init__(self, n_splits: int = 5, stratified: bool = False, n_jobs: int = 1, seed: Optional[int] = None):
+        if n_splits < 2:
+            raise ValueError("Cross-validation needs at least 2 folds.")
+        self.n_splits = n_splits
+        self.stratified = stratified
+        self.n_jobs = n_jobs
+        self.seed = seed
+
+    def run(self, data: EncodedData) -> CrossValidationResult:
+        seeds = random.Random(self.seed).sample(range(2 ** 32), self.n_splits)  # tie-breaking of every fold
+        if self.n_jobs <= 1:
+            splits = _splits(data, self.n_splits, self.stratified, self.seed)
+            index = CoverageIndex(data)
+            return CrossValidationResult([_run_fold(index, fold, train_rows, test_rows, seeds[fold])
+                                          for fold, (train_rows, test_rows) in enumerate(splits)])
+        with SharedEncodedData(data) as shared, \
+                ProcessPoolExecutor(min(self.n_jobs, self.n_splits), initializer=_init_fold_worker,
+                                    initargs=(shared.spec, self.n_splits, self.stratified, self.seed)) as executor:
+            futures = [executor.submit(_fold_worker, fold, seeds[fold]) for fold in range(self.n_splits)]
+            return CrossValidationResult([f.result() for f in futures])
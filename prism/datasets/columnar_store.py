@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from datasets.encoded_data import EncodedData, code_dtype
+
+
+def plain_value(val):
+    """
+    Python value of a numpy scalar (for the JSON value dictionary)
+    """
+    return val.item() if isinstance(val, np.generic) else val
+
+
+class ColumnarStore:
+    """
+    Binary storage of a dataset: one .npy array of value codes per part (train, test) and a value dictionary,
+    the arrays are memory-mapped on load, so opening a dataset doesn't read the data
+
+    Codes of the training part are the factorized encoding used by the fit (values in order of appearance),
+    values occurring only in the testing part follow, missing value has the last code. Training instances
+    appended later keep the codes of known values, their new values get codes before the missing value.
+    Codes are stored in the smallest integer type for the column with the most values (int8 for binned data).
+    """
+
+    VERSION = 1
+    PARTS = ("train", "test")
+
+    def __init__(self, dirname: str, columns: List[str], values: List[list], num_train_values: List[int],
+                 codes: dict):
+        self.dirname = dirname
+        self.columns = columns
+        self.values = values  # values[j][c] = value encoded by code c in column j
+        self.num_train_values = num_train_values  # number of distinct values of column j in the training part
+        self.codes = codes  # codes[part] = (instances x columns) array of value codes
+
+    @staticmethod
+    def path(dirname: str) -> str:
+        return f"{dirname}/store"
+
+    @classmethod
+    def exists(cls, dirname: str) -> bool:
+        return os.path.isfile(f"{cls.path(dirname)}/meta.json")
+
+    @classmethod
+    def save(cls, dirname: str, train: pd.DataFrame, test: pd.DataFrame) -> 'ColumnarStore':
+        columns = list(train.columns)
+        col_codes, values, num_train_values = [], [], []
+        for col in columns:
+            codes, uniques = pd.factorize(pd.concat([train[col], test[col]], ignore_index=True))
+            uniques = [plain_value(v) for v in uniques]
+            missing = codes == -1
+            if missing.any():
+                codes[missing] = len(uniques)
+                uniques.append(np.nan)
+            col_codes.append(codes.astype(code_dtype(len(uniques))))
+            values.append(uniques)
+            num_train_values.append(len(np.unique(codes[:len(train)])))
+
+        dtype = code_dtype(max((len(v) for v in values), default=0))
+        codes = {part: np.empty((len(df), len(columns)), dtype=dtype, order='F')
+                 for part, df in zip(cls.PARTS, (train, test))}
+        for j in range(len(columns)):
+            codes["train"][:, j] = col_codes[j][:len(train)]
+            codes["test"][:, j] = col_codes[j][len(train):]
+            col_codes[j] = None
+
+        os.makedirs(cls.path(dirname), exist_ok=True)
+        for part in cls.PARTS:
+            filename = f"{cls.path(dirname)}/{part}.npy"
+            if os.path.isfile(filename):
+                os.remove(filename)  # a new file, arrays of the old store may still be memory-mapped
+            np.save(filename, codes[part])
+        cls.write_meta(dirname, columns, values, num_train_values)
+        return cls(dirname, columns, values, num_train_values, codes)
+
+    @classmethod
+    def write_meta(cls, dirname: str, columns: List[str], values: List[list], num_train_values: List[int]):
+        filename = f"{cls.path(dirname)}/meta.json"
+        with open(f"{filename}.tmp", "w") as f:
+            f.write(json.dumps({"version": cls.VERSION, "columns": columns, "values": values,
+                                "num_train_values": num_train_values}))
+        os.replace(f"{filename}.tmp", filename)
+
+    @classmethod
+    def load(cls, dirname: str) -> 'ColumnarStore':
+        with open(f"{cls.path(dirname)}/meta.json", "r") as f:
+            meta = json.loads(f.read())
+        if meta["version"] > cls.VERSION:
+            raise ValueError(f"Dataset storage in {dirname}/ has unsupported version {meta['version']}.")
+        codes = {part: np.load(f"{cls.path(dirname)}/{part}.npy", mmap_mode='r') for part in cls.PARTS}
+        return cls(dirname, meta["columns"], meta["values"], meta["num_train_values"], codes)
+
+    def append_train(self, df: pd.DataFrame) -> 'ColumnarStore':
+        """
+        Store with the instances added to the training part, encoded by the value dictionary of the store
+        (extended by values it doesn't know), the existing codes are copied as they are, not decoded
+
+        The arrays are written to new files, so arrays of this store, which may still be memory-mapped,
+        keep the old data.
+        """
+        values, new_codes, missing_moved = [], [], []
+        for j, col in enumerate(self.columns):
+            known = list(self.values[j])
+            had_missing = len(known) > 0 and pd.isna(known[-1])
+            if had_missing:
+                known.pop()
+            missing = df[col].isna().to_numpy()
+            present = df[col][~missing].astype(object)
+            index = pd.Index(known, dtype=object)
+            unknown = pd.unique(present[index.get_indexer(present) == -1])
+            if len(unknown) > 0:
+                known.extend(plain_value(v) for v in unknown)
+                index = pd.Index(known, dtype=object)
+            codes = np.full(len(df), len(known), dtype=np.int64)  # missing value has the last code
+            codes[~missing] = index.get_indexer(present)
+            if had_missing or missing.any():
+                known.append(np.nan)
+            values.append(known)
+            new_codes.append(codes)
+            missing_moved.append(had_missing and len(unknown) > 0)
+
+        dtype = code_dtype(max((len(v) for v in values), default=0))
+        num_train_values = []
+        for part in self.PARTS:
+            if part == "test" and dtype == self.codes[part].dtype and not any(missing_moved):
+                continue  # codes of the testing part don't change
+            old = self.codes[part]
+            num_new = len(df) if part == "train" else 0
+            filename = f"{self.path(self.dirname)}/{part}.npy"
+            codes = np.lib.format.open_memmap(f"{filename}.tmp", mode='w+', dtype=dtype,
+                                              shape=(len(old) + num_new, len(self.columns)), fortran_order=True)
+            for j in range(len(self.columns)):
+                if missing_moved[j]:
+                    old_missing = len(self.values[j]) - 1
+                    codes[:len(old), j] = np.where(old[:, j] == old_missing, len(values[j]) - 1, old[:, j])
+                else:
+                    codes[:len(old), j] = old[:, j]
+                if part == "train":
+                    codes[len(old):, j] = new_codes[j]
+                    num_train_values.append(int(np.count_nonzero(np.bincount(codes[:, j],
+                                                                             minlength=len(values[j])))))
+            codes.flush()
+            del codes
+            os.replace(f"{filename}.tmp", filename)
+        self.write_meta(self.dirname, self.columns, values, num_train_values)
+        return self.load(self.dirname)
+
+    def num_instances(self, part: str) -> int:
+        return self.codes[part].shape[0]
+
+    def fingerprint(self, part: str) -> str:
+        """
+        Hash of the decoded content of the part (columns, values and their codes)
+        """
+        codes = self.codes[part]
+        h = hashlib.blake2b(digest_size=16)
+        h.update(json.dumps(self.columns).encode())
+        for j in range(len(self.columns)):
+            # values the part uses, numbered in order of their codes, so values of the other part don't matter
+            used = np.flatnonzero(np.bincount(codes[:, j], minlength=len(self.values[j])))
+            remap = np.zeros(len(self.values[j]), dtype=np.int32)
+            remap[used] = np.arange(len(used), dtype=np.int32)
+            h.update(json.dumps([self.values[j][c] for c in used.tolist()], default=str).encode())
+            h.update(np.ascontiguousarray(remap[codes[:, j]]).data)
+        return h.hexdigest()
+
+    def num_values(self, col: str) -> int:
+        """
+        Number of distinct non-missing values of the column in the training part (as pd.Series.nunique)
+        """
+        j = self.columns.index(col)
+        has_missing = len(self.values[j]) > 0 and pd.isna(self.values[j][-1]) and \
+            bool((self.codes["train"][:, j] == len(self.values[j]) - 1).any())
+        return self.num_train_values[j] - int(has_missing)
+
+    def frame(self, part: str) -> pd.DataFrame:
+        """
+        Decoded DataFrame of the part, columns are categorical with the values of the store as their categories
+        (codes of the store's integer type, categories shared by the parts instead of a Python object per value)
+        """
+        codes = self.codes[part]
+        return pd.DataFrame({col: self.__categorical(j, codes[:, j]) for j, col in enumerate(self.columns)})
+
+    def __categorical(self, j: int, codes: np.ndarray) -> pd.Categorical:
+        values = self.values[j]
+        if len(values) > 0 and pd.isna(values[-1]):  # missing value isn't a category, its code is -1
+            codes = np.where(codes == len(values) - 1, -1, codes).astype(codes.dtype)
+            values = values[:-1]
+        return pd.Categorical.from_codes(codes, categories=pd.Index(values, dtype=None if len(values) > 0 else object))
+
+    def memory_usage(self) -> dict:
+        """
+        Bytes of the codes of every part (memory-mapped, only the touched pages are loaded)
+        """
+        return {part: int(self.codes[part].nbytes) for part in self.PARTS}
+
+    def encoded(self, y_name: str) -> EncodedData:
+        """
+        Encoded training data for the fit, built directly from the stored codes
+        """
+        codes = self.codes["train"]
+        y_j = self.columns.index(y_name)
+        attributes = [col for col in self.columns if col != y_name]
+        att_j = [self.columns.index(att) for att in attributes]
+        y = np.array(codes[:, y_j], dtype=code_dtype(len(self.values[y_j])))
+        classes = list(self.values[y_j])
+        if len(classes) > 0 and pd.isna(classes[-1]):  # missing target doesn't belong to any class
+            y[y == len(classes) - 1] = -1
+            classes = classes[:-1]
+        return EncodedData(attributes, np.asfortranarray(codes[:, att_j]), [self.values[j] for j in att_j], y, classes)
+
+
+class ColumnarStoreWriter:
+    """
+    Writes a columnar store chunk by chunk, for data that don't fit into memory
+
+    The number of instances of every part has to be known in advance, codes are assigned as values come
+    and reordered on close, so the result is the same as of ColumnarStore.save on the whole data
+    """
+
+    def __init__(self, dirname: str, columns: List[str], num_instances: dict):
+        self.dirname = dirname
+        self.columns = columns
+        os.makedirs(ColumnarStore.path(dirname), exist_ok=True)
+        self.codes = {part: np.lib.format.open_memmap(f"{ColumnarStore.path(dirname)}/{part}.npy", mode='w+',
+                                                      dtype=np.int32, shape=(num_instances[part], len(columns)),
+                                                      fortran_order=True)
+                      for part in ColumnarStore.PARTS}
+        self.written = {part: 0 for part in ColumnarStore.PARTS}
+        self.values: List[list] = [[] for _ in columns]
+        self._index = [pd.Index([], dtype=object) for _ in columns]
+        self._missing_code = [-1 for _ in columns]
+        self._first_train = [{} for _ in columns]  # code -> first training instance with the value
+
+    def append(self, part: str, df: pd.DataFrame):
+        start = self.written[part]
+        for j, col in enumerate(self.columns):
+            codes = self.__encode(j, df[col])
+            self.codes[part][start:start + len(df), j] = codes
+            if part == "train":
+                uniques, first = np.unique(codes, return_index=True)
+                for code, i in zip(uniques.tolist(), first.tolist()):
+                    self._first_train[j].setdefault(code, start + i)
+        self.written[part] += len(df)
+
+    def __encode(self, j: int, values: pd.Series) -> np.ndarray:
+        missing = values.isna().to_numpy()
+        if missing.any() and self._missing_code[j] == -1:
+            self._missing_code[j] = len(self.values[j])
+            self.values[j].append(np.nan)
+            self._index[j] = pd.Index(self.values[j], dtype=object)
+        present = values[~missing].astype(object)
+        new = pd.unique(present[self._index[j].get_indexer(present) == -1])
+        if len(new) > 0:
+            self.values[j].extend(plain_value(v) for v in new)
+            self._index[j] = pd.Index(self.values[j], dtype=object)
+        codes = np.full(len(values), self._missing_code[j], dtype=np.int32)
+        codes[~missing] = self._index[j].get_indexer(present)
+        return codes
+
+    def close(self) -> ColumnarStore:
+        """
+        Reorder codes (training values in order of appearance, then testing ones, missing value last)
+        and write the value dictionary
+        """
+        values, num_train_values = [], []
+        for j in range(len(self.columns)):
+            num_codes = len(self.values[j])
+            order = sorted(range(num_codes), key=lambda c: (c == self._missing_code[j],
+                                                            self._first_train[j].get(c, np.inf), c))
+            remap = np.empty(max(num_codes, 1), dtype=np.int32)
+            remap[order] = np.arange(num_codes, dtype=np.int32)
+            for part in ColumnarStore.PARTS:
+                self.codes[part][:, j] = remap[self.codes[part][:, j]]  # one column at a time, bounded by its size
+            values.append([self.values[j][c] for c in order])
+            num_train_values.append(len(self._first_train[j]))
+        for part in ColumnarStore.PARTS:
+            self.codes[part].flush()
+        self.__narrow(code_dtype(max((len(v) for v in values), default=0)))
+        ColumnarStore.write_meta(self.dirname, self.columns, values, num_train_values)
+        return ColumnarStore.load(self.dirname)
+
+    def __narrow(self, dtype: np.dtype):
+        """
+        Rewrite the codes in the smallest integer type (the number of values isn't known while writing),
+        one column at a time
+        """
+        if dtype == np.int32:
+            return
+        for part in ColumnarStore.PARTS:
+            filename = f"{ColumnarStore.path(self.dirname)}/{part}.npy"
+            narrow = np.lib.format.open_memmap(f"{filename}.tmp", mode='w+', dtype=dtype,
+                                               shape=self.codes[part].shape, fortran_order=True)
+            for j in range(len(self.columns)):
+                narrow[:, j] = self.codes[part][:, j]
+            narrow.flush()
+            del narrow
+            self.codes[part] = None
+            os.replace(f"{filename}.tmp", filename)
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from datasets.encoded_data import EncodedData
+
+
+def pack(mask: np.ndarray) -> np.ndarray:
+    """
+    Pack boolean mask(s) (along the last axis) into bitmaps of 64-bit words
+    """
+    packed = np.packbits(mask, axis=-1, bitorder='little')
+    pad = (-packed.shape[-1]) % 8
+    if pad > 0:
+        packed = np.concatenate([packed, np.zeros(packed.shape[:-1] + (pad,), dtype=np.uint8)], axis=-1)
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def unpack(bits: np.ndarray, size: int) -> np.ndarray:
+    return np.unpackbits(bits.view(np.uint8), count=size, bitorder='little').astype(bool)
+
+
+if hasattr(np, "bitwise_count"):
+    def popcount(bits: np.ndarray) -> int:
+        return int(np.bitwise_count(bits).sum())
+else:
+    _BYTE_COUNTS = np.array([bin(b).count('1') for b in range(256)], dtype=np.uint8)
+
+    def popcount(bits: np.ndarray) -> int:
+        return int(_BYTE_COUNTS[bits.view(np.uint8)].sum(dtype=np.int64))
+
+
+class CoverageIndex:
+    """
+    Packed bitmaps of the instances covered by every (attribute, value) condition and by every class,
+    coverage of a rule is the AND of bitmaps of its operands
+    """
+
+    def __init__(self, data: EncodedData):
+        self.data = data
+        self.size = len(data)
+        self.all = pack(np.ones(self.size, dtype=bool))
+        self.empty = np.zeros_like(self.all)
+        self.bitmaps = []  # bitmaps[j][c] = instances with value code c of attribute j
+        for j in range(len(data.attributes)):
+            self.bitmaps.append(self.__pack_codes(data.codes[:, j], len(data.values[j])))
+        self.class_bitmaps = self.__pack_codes(data.y, len(data.classes))
+
+    def __pack_codes(self, codes: np.ndarray, num_codes: int) -> np.ndarray:
+        bitmaps = np.empty((num_codes, len(self.all)), dtype=np.uint64)
+        for c in range(num_codes):
+            bitmaps[c] = pack(codes == c)
+        return bitmaps
+
+    def operand_bits(self, att: str, val) -> np.ndarray:
+        code = self.data.value_code(att, val)
+        if code == -1:
+            return self.empty
+        return self.bitmaps[self.data.att_index[att]][code]
+
+    def rule_bits(self, operands: dict) -> np.ndarray:
+        bits = self.all
+        for att, val in operands.items():
+            bits = bits & self.operand_bits(att, val)
+        return bits
+
+    def class_bits(self, cl) -> np.ndarray:
+        code = self.data.class_code(cl)
+        if code is None:
+            return self.empty
+        return self.class_bitmaps[code]
+
+
+class EncodedRows:
+    """
+    Subset of the instances of encoded data stored as a bitmap over the coverage index,
+    used by rules in place of a DataFrame with the 'y' column
+    """
+
+    def __init__(self, index: CoverageIndex, bits: np.ndarray = None):
+        self.index = index
+        self.bits = index.all if bits is None else bits
+        self._value_codes = {}
+
+    def __len__(self):
+        return popcount(self.bits)
+
+    @property
+    def data(self) -> EncodedData:
+        return self.index.data
+
+    @property
+    def attributes(self):
+        return self.index.data.attributes
+
+    @property
+    def mask(self) -> np.ndarray:
+        return unpack(self.bits, self.index.size)
+
+    def restrict(self, bits: np.ndarray) -> 'EncodedRows':
+        return EncodedRows(self.index, self.bits & bits)
+
+    def exclude(self, bits: np.ndarray) -> 'EncodedRows':
+        return EncodedRows(self.index, self.bits & ~bits)
+
+    def of_class(self, cl) -> 'EncodedRows':
+        return self.restrict(self.index.class_bits(cl))
+
+    def value_codes(self, att: str) -> np.ndarray:
+        """
+        Codes of the values of the attribute present in the rows, in order of appearance
+        """
+        if att not in self._value_codes:  # rows never change, the order can be reused by every operand of a rule
+            self._value_codes[att] = pd.unique(self.data.codes[:, self.data.att_index[att]][self.mask])
+        return self._value_codes[att]
@@ -1,34 +1,180 @@
 import json
 import os.path
 import shutil
-from typing import List
+from typing import List, Optional
 
 import pandas as pd
 
-from datasets.preprocessing import DataPreprocessor
+from datasets.columnar_store import ColumnarStore
+from datasets.dataset_eval import DatasetEval
+from datasets.encoded_data import EncodedData
+from datasets.preprocessing import DataPreprocessor, StreamingDataPreprocessor
+from datasets.result_cache import ResultCache
+from rules.model_artifact import ModelArtifact
 from rules.rule import Rule
+from rules.rule_eval import RuleEval
 
 
 class Dataset:
-    def __init__(self, dirname: str, y_name: str, name: str, train: pd.DataFrame, test: pd.DataFrame, binning_info=None):
+    def __init__(self, dirname: str, y_name: str, name: str, train: Optional[pd.DataFrame], test: Optional[pd.DataFrame],
+                 binning_info=None, binning_edges=None, store: ColumnarStore = None, stats: dict = None):
+        """
+        train, test - data of the dataset, or None to decode them from the store when they are first needed
+        store       - storage of the data, or None to open it when the data are first needed
+        stats       - number of instances, attributes and targets, computed from the data if not given
+        """
         self.dirname = dirname
         self.y_name = y_name
         self.name = name
-        self.train, self.test = train, test
-        self.num_att = len(self.train.columns) - 1
-        self.num_targ = self.train[self.y_name].nunique()
+        self._train, self._test = train, test
+        self._store = store
+        self._encoded_train: Optional[EncodedData] = None
+        self.stats = stats if stats is not None else self.__compute_stats()
         self.binning_info = binning_info
+        if binning_edges is None and binning_info is not None:
+            binning_edges = DataPreprocessor.edges_from_binning_info(binning_info)
+        self.binning_edges = binning_edges
+
+    @property
+    def store(self) -> ColumnarStore:
+        if self._store is None:
+            self._store = ColumnarStore.load(self.dirname)
+        return self._store
+
+    def load(self):
+        """
+        Open storage of the data (datasets listed from metadata only don't touch the data until now)
+        """
+        return self.store
+
+    @property
+    def train(self) -> pd.DataFrame:
+        if self._train is None:
+            self._train = self.store.frame("train")
+        return self._train
+
+    @property
+    def test(self) -> pd.DataFrame:
+        if self._test is None:
+            self._test = self.store.frame("test")
+        return self._test
+
+    @property
+    def num_inst(self) -> int:
+        return self.stats["num_inst"]
+
+    @property
+    def num_att(self) -> int:
+        return self.stats["num_att"]
+
+    @property
+    def num_targ(self) -> int:
+        return self.stats["num_targ"]
+
+    @property
+    def stats_filename(self):
+        return f"{self.dirname}/stats"
+
+    def __compute_stats(self) -> dict:
+        if self._train is not None and self._test is not None:
+            return {"num_inst": len(self._train) + len(self._test), "num_att": len(self._train.columns) - 1,
+                    "num_targ": int(self._train[self.y_name].nunique())}
+        return {"num_inst": self.store.num_instances("train") + self.store.num_instances("test"),
+                "num_att": len(self.store.columns) - 1, "num_targ": self.store.num_values(self.y_name)}
+
+    def save_stats(self):
+        with open(self.stats_filename, "w") as f:
+            f.write(json.dumps(self.stats))
+
+    def fingerprint(self, part: str) -> str:
+        """
+        Fingerprint of the training or testing data, kept with the statistics once computed
+        """
+        fingerprints = self.stats.setdefault("fingerprints", {})
+        if part not in fingerprints:
+            fingerprints[part] = self.store.fingerprint(part)
+            self.save_stats()
+        return fingerprints[part]
+
+    @property
+    def results(self) -> ResultCache:
+        """
+        Cache of fitted rules and evaluations, shared by the datasets of the same directory
+        """
+        return ResultCache.shared(f"{os.path.dirname(self.dirname) or '.'}/{ResultCache.DIRNAME}")
+
+    def memory_report(self, decode: bool = False) -> dict:
+        """
+        Memory footprint in bytes: codes of the store, encoded training data of the fit and decoded frames
+        (those decoded so far, or both if decode), default_frames estimates frames with 8 bytes per value
+        (int64, float64 or object columns)
+        """
+        parts = (("train", self.train if decode else self._train), ("test", self.test if decode else self._test))
+        frames = {part: int(df.memory_usage(deep=True).sum()) for part, df in parts if df is not None}
+        return {"name": self.name, "instances": self.num_inst, "columns": len(self.store.columns),
+                "codes_dtype": str(self.store.codes["train"].dtype), "store": self.store.memory_usage(),
+                "encoded_train": self.encoded_train.nbytes, "frames": frames,
+                "default_frames": 8 * self.num_inst * len(self.store.columns)}
+
+    @property
+    def encoded_train(self) -> EncodedData:
+        """
+        Training data factorized for the fit, taken from the store without decoding the data
+        """
+        if self._encoded_train is None:
+            if self._store is not None or self._train is None:
+                self._encoded_train = self.store.encoded(self.y_name)
+            else:
+                self._encoded_train = EncodedData.from_frame(self.X_train, self.y_train)
+        return self._encoded_train
+
+    def append_train(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add new training instances, numerical attributes are binned by the edges of the dataset,
+        returns the added instances as they are stored
+        """
+        wrong_att = [col for col in self.store.columns if col not in df.columns]
+        if len(wrong_att) > 0:
+            raise ValueError(f"New instances miss attributes of the dataset: {', '.join(wrong_att)}")
+        new = DataPreprocessor.apply_edges(df, self.binning_edges or {}, include_lowest=True)  # like the training data
+        new = new[list(self.store.columns)]
+        self._store = self.store.append_train(new)  # the stored data aren't decoded
+        self._train, self._test, self._encoded_train = None, None, None  # decoded from the store when needed
+        self.stats = self.__compute_stats()
+        self.save_stats()
+        self.fingerprint("train")  # rules of the previous data are stale now
+        return new
 
     @property
     def rules_filename(self):
         return f"{self.dirname}/rules.json"
 
+    @property
+    def model_filename(self):
+        return f"{self.dirname}/model.prism"
+
     @property
     def rules_available(self):
-        if os.path.isfile(self.rules_filename):
-            return True
-        else:
-            return False
+        return self.__rules_source() is not None
+
+    def __rules_source(self) -> Optional[str]:
+        """
+        Where rules for the current training data are: the stored model unless the data changed since it was
+        saved, the result cache, or rules imported as JSON (rules.json) if no model was saved yet
+        """
+        if os.path.isfile(self.model_filename):
+            fingerprint = ModelArtifact.read_header(self.model_filename).get("fingerprint")
+            if fingerprint is None or fingerprint == self.fingerprint("train"):
+                return "model"
+        if self.results.contains(ResultCache.key("rules", self.fingerprint("train"))):
+            return "cache"
+        if not os.path.isfile(self.model_filename) and os.path.isfile(self.rules_filename):
+            return "json"
+        return None
+
+    @property
+    def checkpoint_dirname(self):
+        return f"{self.dirname}/checkpoint"
 
     @property
     def rules_eval_filename(self):
@@ -51,19 +197,77 @@ class Dataset:
         return self.test[self.y_name]
 
     def save_rules(self, rules: List[Rule]):
-        with open(self.rules_filename, "w") as f:
-            f.write("{\"rules\": [" + ','.join([r.toJson() for r in rules]) + "]}")
+        """
+        Store the rules as the model of the dataset and in the result cache, both under the training data fingerprint
+        """
+        fingerprint = self.fingerprint("train")
+        ModelArtifact.from_rules(rules, self.binning_edges, fingerprint).save(self.model_filename)
+        self.results.put_rules(fingerprint, rules)
+
+    def load_model(self) -> ModelArtifact:
+        """
+        Rules for the current training data (see rules_available), a stale model is replaced by the cached rules
+        """
+        source = self.__rules_source()
+        if source == "model":
+            return ModelArtifact.load(self.model_filename)
+        if source == "cache":
+            rules = self.results.get_rules(self.fingerprint("train"))
+            if rules is not None:
+                model = ModelArtifact.from_rules(rules, self.binning_edges, self.fingerprint("train"))
+                model.save(self.model_filename)
+                return model
+        if source == "json":
+            return ModelArtifact.from_rules(self.read_rules_json(self.rules_filename), self.binning_edges)
+        raise ValueError(f"Dataset {self.name} has no rules for its current data.")
 
     def load_rules(self) -> List[Rule]:
-        rules = []
-        with open(self.rules_filename, "r") as f:
-            lines = json.loads(f.readline())["rules"]
-            for line in lines:
-                rules.append(Rule(line["cl"], line["operands"]))
-        return rules
+        return self.load_model().rules
+
+    def export_rules(self, filename: str):
+        self.write_rules_json(filename, self.load_rules())
+
+    def evaluate_rules(self, prism) -> List[RuleEval]:
+        """
+        Prism.evaluate_rules on the training data, the result is cached for the data and rules
+        """
+        key = ResultCache.key("rules_eval", self.fingerprint("train"), ResultCache.rules_fingerprint(prism.rules))
+        cached = self.results.get(key)
+        if cached is not None:
+            return [RuleEval(precision, coverage, rule) for (precision, coverage), rule in zip(cached, prism.rules)]
+        rules_eval = prism.evaluate_rules(self.X_train, self.y_train)
+        self.results.put(key, [[r.precision, r.coverage] for r in rules_eval])
+        return rules_eval
+
+    def evaluate_dataset(self, prism) -> DatasetEval:
+        """
+        Prism.evaluate_dataset on the testing data, the result is cached for the data and rules
+        """
+        key = ResultCache.key("dataset_eval", self.fingerprint("test"), ResultCache.rules_fingerprint(prism.rules))
+        cached = self.results.get(key)
+        if cached is not None:
+            return DatasetEval(**cached)
+        d_eval = prism.evaluate_dataset(self.X_test, self.y_test)
+        self.results.put(key, vars(d_eval))
+        return d_eval
+
+    @staticmethod
+    def write_rules_json(filename: str, rules: List[Rule]):
+        with open(filename, "w") as f:
+            f.write("{\"rules\": [" + ','.join([r.toJson() for r in rules]) + "]}")
+
+    @staticmethod
+    def read_rules_json(filename: str) -> List[Rule]:
+        with open(filename, "r") as f:
+            return [Rule(r["cl"], r["operands"]) for r in json.load(f)["rules"]]
 
     @classmethod
-    def create_from_file(cls, source_filename: str, y_name: str, name: str, top_dir: str, rules_file: str = None):
+    def create_from_file(cls, source_filename: str, y_name: str, name: str, top_dir: str, rules_file: str = None,
+                         chunk_size: int = None, max_values: int = 5):
+        """
+        chunk_size - preprocess the source file in chunks of this many rows instead of loading it whole
+        max_values - numerical attributes with more values are binned into this many bins
+        """
         if not os.path.isfile(source_filename):
             raise ValueError(f"The file {source_filename} doesn't exist!")
 
@@ -72,8 +276,9 @@ class Dataset:
             raise ValueError(f"Dataset directory {dirname}/ already exists! Please, select different dataset name.")
         os.mkdir(dirname)
 
-        df = pd.read_csv(source_filename)
-        if y_name not in df.columns:
+        df = pd.read_csv(source_filename) if chunk_size is None else None
+        columns = df.columns if df is not None else pd.read_csv(source_filename, nrows=0).columns
+        if y_name not in columns:
             os.rmdir(dirname)
             raise ValueError(f"Target variable {y_name} not found in the dataset.")
 
@@ -82,34 +287,36 @@ class Dataset:
                 os.rmdir(dirname)
                 raise ValueError(f"Rules file {rules_file} doesn't exist!")
             try:
-                rules = []
-                with open(rules_file) as f:
-                    lines = json.loads(f.readline())["rules"]
-                    for line in lines:
-                        rules.append(Rule(line["cl"], line["operands"]))
+                rules = cls.read_rules_json(rules_file)
             except Exception as e:
                 os.rmdir(dirname)
                 raise ValueError(f"Rules file isn't valid, error:\n{e}")
             attributes = set([att for r in rules for att in list(r.operands.keys())])
-            wrong_att = [att for att in attributes if att not in df.columns]
+            wrong_att = [att for att in attributes if att not in columns]
             if len(wrong_att) > 0:
                 os.rmdir(dirname)
                 raise ValueError(f"Rules contain attributes that aren't present in the dataset!\n"
                                  f"Invalid attributes: {', '.join(wrong_att)}")
             shutil.copyfile(rules_file, f"{dirname}/rules.json")
 
-        prep = DataPreprocessor(df, y_name)
-        prep.apply_binning()
-        train, test = prep.get_train_test()
-
-        train.to_csv(f"{dirname}/train.csv", index=False)
-        test.to_csv(f"{dirname}/test.csv", index=False)
+        if df is not None:
+            prep = DataPreprocessor(df, y_name)
+            prep.apply_binning(max_values)
+            store = ColumnarStore.save(dirname, *prep.get_train_test())
+        else:
+            prep = StreamingDataPreprocessor(source_filename, y_name, chunk_size=chunk_size)
+            prep.apply_binning(max_values)
+            store = prep.write_store(dirname)
 
-        config = {"name": name, "y_name": y_name, "binning_info": prep.binning_info}
+        config = {"name": name, "y_name": y_name, "binning_info": prep.binning_info, "binning_edges": prep.binning_edges}
         with open(f"{dirname}/config", "w") as f:
             f.write(json.dumps(config))
 
-        return cls(dirname, y_name, name, train, test, prep.binning_info)
+        # the data are decoded from the store when needed, in its compact form
+        dataset = cls(dirname, y_name, name, None, None, prep.binning_info, prep.binning_edges, store)
+        for part in ColumnarStore.PARTS:
+            dataset.fingerprint(part)  # saves the statistics
+        return dataset
 
     @classmethod
     def load_from_storage(cls, dirname: str):
@@ -117,15 +324,41 @@ class Dataset:
             raise ValueError(f"Directory {dirname} doesn't exist!")
         if not os.path.isfile(f"{dirname}/config"):
             raise ValueError(f"Directory {dirname} isn't valid dataset repository, there is no config file.")
-        if not os.path.isfile(f"{dirname}/train.csv"):
-            raise ValueError(f"Directory {dirname} isn't valid dataset repository, training data are missing.")
-        if not os.path.isfile(f"{dirname}/test.csv"):
-            raise ValueError(f"Directory {dirname} isn't valid dataset repository, testing data are missing.")
+        if not ColumnarStore.exists(dirname):
+            cls.__migrate_csv(dirname)
 
         with open(f"{dirname}/config", "r") as f:
             config = json.loads(f.read())
 
-        train = pd.read_csv(f"{dirname}/train.csv")
-        test = pd.read_csv(f"{dirname}/test.csv")
+        store = ColumnarStore.load(dirname)
+        return cls(dirname, config["y_name"], config["name"], None, None, config["binning_info"],
+                   config.get("binning_edges"), store)
 
-        return cls(dirname, config["y_name"], config["name"], train, test, config["binning_info"])
+    @classmethod
+    def load_metadata(cls, dirname: str):
+        """
+        Dataset with configuration and statistics only, the data are opened when they are first needed
+        """
+        if not os.path.isfile(f"{dirname}/stats") or not os.path.isfile(f"{dirname}/config"):
+            dataset = cls.load_from_storage(dirname)  # stored before statistics were kept, compute them once
+            dataset.save_stats()
+            return dataset
+
+        with open(f"{dirname}/config", "r") as f:
+            config = json.loads(f.read())
+        with open(f"{dirname}/stats", "r") as f:
+            stats = json.loads(f.read())
+        return cls(dirname, config["y_name"], config["name"], None, None, config["binning_info"],
+                   config.get("binning_edges"), stats=stats)
+
+    @staticmethod
+    def __migrate_csv(dirname: str):
+        """
+        Convert a dataset directory with train.csv and test.csv into the columnar storage,
+        the CSV files are kept, so older versions of the application can still read the dataset
+        """
+        if not os.path.isfile(f"{dirname}/train.csv"):
+            raise ValueError(f"Directory {dirname} isn't valid dataset repository, training data are missing.")
+        if not os.path.isfile(f"{dirname}/test.csv"):
+            raise ValueError(f"Directory {dirname} isn't valid dataset repository, testing data are missing.")
+        ColumnarStore.save(dirname, pd.read_csv(f"{dirname}/train.csv"), pd.read_csv(f"{dirname}/test.csv"))
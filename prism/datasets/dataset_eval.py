@@ -1,5 +1,30 @@
+import pandas as pd
+
+
 class DatasetEval:
     def __init__(self, accuracy_all: float, accuracy_classified: float, coverage: float):
         self.accuracy_all = accuracy_all  # correctly classified instances / instances
         self.accuracy_classified = accuracy_classified  # correctly classified instances / classified instances
         self.coverage = coverage  # classified instances / all instances
+
+
+class DatasetEvalAccumulator:
+    """
+    Builds DatasetEval incrementally from batches of (true classes, obtained classes)
+    """
+
+    def __init__(self):
+        self.num_inst = 0
+        self.num_correct = 0
+        self.num_classified = 0
+
+    def update(self, y_true: pd.Series, y_obt: pd.Series):
+        y_true, y_obt = y_true.reset_index(drop=True), y_obt.reset_index(drop=True)
+        self.num_inst += len(y_true)
+        self.num_correct += len(y_true) - len(y_true.compare(y_obt))  # same as Prism.evaluate_dataset
+        self.num_classified += y_obt.count()
+
+    def result(self) -> DatasetEval:
+        return DatasetEval(self.num_correct / self.num_inst if self.num_inst > 0 else 0,
+                           self.num_correct / self.num_classified if self.num_classified > 0 else 0,
+                           self.num_classified / self.num_inst if self.num_inst > 0 else 0)
@@ -19,7 +19,9 @@ class DatasetsManager:
             os.mkdir(self.top_dir)
         else:
             for subdir in sorted(os.listdir(self.top_dir)):
-                self.datasets.append(Dataset.load_from_storage(f"{self.top_dir}/{subdir}"))
+                if subdir.startswith("."):  # result cache, not a dataset
+                    continue
+                self.datasets.append(Dataset.load_metadata(f"{self.top_dir}/{subdir}"))
 
     def add_dataset(self, dataset: Dataset):
         self.datasets.append(dataset)
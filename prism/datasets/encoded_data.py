@@ -0,0 +1,140 @@
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def code_dtype(num_codes: int) -> np.dtype:
+    """
+    Smallest signed integer type for codes 0 .. num_codes - 1 (and -1 for a missing target)
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if num_codes - 1 <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class EncodedData:
+    """
+    Training data with every attribute and the target variable factorized into integer codes
+
+    codes       - (instances x attributes) array, codes[i, j] is the code of the value of attribute j in instance i,
+                  of the smallest integer type for the attribute with the most values
+    values      - values[j][c] is the original value encoded by code c of attribute j
+    y           - codes of the target variable (-1 for a missing target)
+    classes     - classes[c] is the original class encoded by code c
+    """
+
+    def __init__(self, attributes: List[str], codes: np.ndarray, values: List[list], y: np.ndarray, classes: list):
+        self.attributes = attributes
+        self.codes = codes
+        self.values = values
+        self.y = y
+        self.classes = classes
+        self.att_index = {att: j for j, att in enumerate(attributes)}
+        self._value_index = [pd.Index(v, dtype=object) for v in values]
+        self._class_index = pd.Index(classes, dtype=object)
+
+    def __len__(self):
+        return len(self.y)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.y.nbytes
+
+    @classmethod
+    def from_frame(cls, X: pd.DataFrame, y: pd.Series):
+        att_codes, values = [], []
+        for att in X.columns:
+            col_codes, uniques = pd.factorize(X[att])
+            uniques = list(uniques)
+            missing = col_codes == -1
+            if missing.any():  # missing values are matched by rules too (isnull() in the query), give them own code
+                col_codes[missing] = len(uniques)
+                uniques.append(np.nan)
+            att_codes.append(col_codes.astype(code_dtype(len(uniques))))
+            values.append(uniques)
+        codes = np.empty((len(X), len(X.columns)), dtype=code_dtype(max((len(v) for v in values), default=0)),
+                         order='F')
+        for j, col_codes in enumerate(att_codes):
+            codes[:, j] = col_codes
+            att_codes[j] = None
+        y_codes, classes = pd.factorize(y)
+        return cls(list(X.columns), codes, values, y_codes.astype(code_dtype(len(classes))), list(classes))
+
+    def subset(self, rows: np.ndarray) -> 'EncodedData':
+        """
+        Encoded data of the given instances, with the same value dictionary (codes keep their meaning)
+        """
+        return EncodedData(self.attributes, np.asfortranarray(self.codes[rows]), self.values, self.y[rows],
+                           self.classes)
+
+    def to_frame(self):
+        """
+        Decoded attributes and target variable (X, y)
+        """
+        X = pd.DataFrame({att: pd.Series(self.values[j], dtype=object).take(self.codes[:, j]).reset_index(drop=True)
+                          for j, att in enumerate(self.attributes)})
+        classes = pd.Series(list(self.classes) + [np.nan], dtype=object)
+        return X, classes.take(self.y).reset_index(drop=True)  # -1 (missing target) takes the last item
+
+    def value_code(self, att: str, val) -> int:
+        """
+        Code of the value of the attribute, -1 if the value doesn't occur in the data
+        """
+        try:
+            return self._value_index[self.att_index[att]].get_loc(val)
+        except KeyError:
+            return -1
+
+    def class_code(self, cl) -> Optional[int]:
+        if pd.isna(cl):  # instances with missing target never belong to any class
+            return None
+        try:
+            return self._class_index.get_loc(cl)
+        except KeyError:
+            return None
+
+
+class SharedEncodedData:
+    """
+    Codes of encoded data copied into shared memory, worker processes attach to them instead of receiving a copy
+
+    Use as a context manager, the shared memory is released on exit
+    """
+
+    def __init__(self, data: EncodedData):
+        self._shm: List[SharedMemory] = []
+        arrays = []
+        for arr in (data.codes, data.y):
+            shm = SharedMemory(create=True, size=max(arr.nbytes, 1))
+            order = 'F' if arr.flags.f_contiguous else 'C'
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, order=order)[...] = arr
+            self._shm.append(shm)
+            arrays.append((shm.name, arr.shape, arr.dtype.str, order))
+        self.spec = (data.attributes, data.values, data.classes, arrays)  # picklable description for attach()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
+
+    @staticmethod
+    def attach(spec) -> EncodedData:
+        attributes, values, classes, arrays = spec
+        shms, views = [], []
+        for name, shape, dtype, order in arrays:
+            shm = SharedMemory(name=name)
+            shms.append(shm)
+            views.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, order=order))
+        data = EncodedData(attributes, views[0], values, views[1], classes)
+        data._shm = shms  # keep the segments mapped as long as the data lives
+        return data
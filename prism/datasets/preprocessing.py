@@ -1,21 +1,27 @@
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 
+from datasets.columnar_store import ColumnarStore, ColumnarStoreWriter
+
 
 class DataPreprocessor:
     def __init__(self, df: pd.DataFrame, y_name: str):
         self.y_name = y_name
         self.train, self.test = train_test_split(df)
         self.binning_info = None
+        self.binning_edges = None
 
     def get_train_test(self):
         return self.train, self.test
 
     def apply_binning(self, max_values: int = 5):
         self.binning_info = {}
+        self.binning_edges = {}
 
         def _numerical(df, col_name):
             return df.dtypes[col_name] == np.int64 or df.dtypes[col_name] == np.float64
@@ -26,8 +32,185 @@ class DataPreprocessor:
                 logging.info(f"{col} - too many values ({self.train[col].nunique()})")
                 self.train[col], bins = pd.qcut(self.train[col], q=max_values, precision=2, retbins=True, duplicates='drop')
                 self.binning_info[col] = {i: str(c) for i, c in enumerate(self.train[col].cat.categories)}
+                self.binning_edges[col] = [float(b) for b in bins]
                 self.train[col] = self.train[col].cat.codes
-                self.test[col] = pd.cut(self.test[col], bins=bins)
-                self.test[col] = self.test[col].cat.codes
+                self.test[col] = self.bin_column(self.test[col], bins)
             else:
                 logging.info(f"{col} - ok ({self.train[col].nunique()} = {', '.join(str(v) for v in self.train[col].unique())})")
+
+    @staticmethod
+    def bin_column(values: pd.Series, edges, include_lowest: bool = False) -> pd.Series:
+        """
+        Category codes of values binned by the edges found on the training data (-1 outside of the bins)
+
+        include_lowest - the lowest edge belongs to the first bin, as the training minimum does in qcut
+        """
+        return pd.cut(values, bins=edges, include_lowest=include_lowest).cat.codes
+
+    @classmethod
+    def apply_edges(cls, df: pd.DataFrame, binning_edges: dict, include_lowest: bool = False) -> pd.DataFrame:
+        """
+        Bin new data the same way apply_binning binned the testing data
+        (or the training data if include_lowest, for new training instances)
+        """
+        df = df.copy()
+        for col, edges in binning_edges.items():
+            if col in df.columns:
+                df[col] = cls.bin_column(df[col], edges, include_lowest)
+        return df
+
+    @staticmethod
+    def edges_from_binning_info(binning_info: dict) -> dict:
+        """
+        Bin edges recovered from the category labels, for datasets stored before the edges were kept
+        (labels are rounded, so the edges are approximate)
+        """
+        edges = {}
+        for col, categories in binning_info.items():
+            intervals = [re.findall(r"-?[\d.]+(?:e[-+]?\d+)?|-?inf", c) for c in categories.values()]
+            edges[col] = [float(intervals[0][0])] + [float(i[1]) for i in intervals]
+        return edges
+
+
+class BinningCache:
+    """
+    Parsed and split data with sorted training values of every numerical column, so the data can be binned
+    with different max_values without reading and sorting them again (same binning as DataPreprocessor)
+    """
+
+    def __init__(self, df: pd.DataFrame, y_name: str, seed: int = None):
+        self.y_name = y_name
+        self.train, self.test = train_test_split(df, random_state=seed)
+        self.sorted_values = {}  # column -> sorted training values (without missing values)
+        for col in self.train.drop(self.y_name, axis=1).columns:
+            if self.train.dtypes[col] == np.int64 or self.train.dtypes[col] == np.float64:
+                self.sorted_values[col] = pd.Series(np.sort(self.train[col].dropna().to_numpy()))
+        self.num_values = {col: int((values.diff() != 0).sum()) for col, values in self.sorted_values.items()}
+
+    @classmethod
+    def from_file(cls, source_filename: str, y_name: str, seed: int = None) -> 'BinningCache':
+        return cls(pd.read_csv(source_filename), y_name, seed)
+
+    def bin(self, max_values: int = 5):
+        """
+        Binned (train, test, binning_info, binning_edges) as DataPreprocessor.apply_binning gives them
+        """
+        train, test = self.train.copy(), self.test.copy()
+        binning_info, binning_edges = {}, {}
+        for col, values in self.sorted_values.items():
+            if self.num_values[col] > max_values:
+                _, bins = pd.qcut(values, q=max_values, retbins=True, duplicates='drop')  # same values, same edges
+                binned = pd.cut(self.train[col], bins=bins, precision=2, include_lowest=True)
+                binning_info[col] = {i: str(c) for i, c in enumerate(binned.cat.categories)}
+                binning_edges[col] = [float(b) for b in bins]
+                train[col] = binned.cat.codes
+                test[col] = DataPreprocessor.bin_column(self.test[col], bins)
+        return train, test, binning_info, binning_edges
+
+
+class StreamingDataPreprocessor:
+    """
+    Preprocessing of a CSV file that doesn't fit into memory, the file is read in chunks (twice):
+
+    1. rows are split into train and test at random, a bounded reservoir sample of training values
+       of every numeric column is kept to estimate quantile bin edges
+    2. columns of every chunk are binned in parallel and written into a columnar store
+
+    binning_info and binning_edges have the same structure as those of DataPreprocessor
+    """
+
+    def __init__(self, source_filename: str, y_name: str, test_size: float = 0.25, chunk_size: int = 100_000,
+                 sample_size: int = 100_000, n_jobs: int = 4, seed: int = None):
+        self.source_filename = source_filename
+        self.y_name = y_name
+        self.test_size = test_size
+        self.chunk_size = chunk_size
+        self.sample_size = sample_size
+        self.n_jobs = n_jobs
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy % 2 ** 32)
+        self.columns = list(pd.read_csv(source_filename, nrows=0).columns)
+        self.binning_info = None
+        self.binning_edges = None
+        self.num_instances = None
+
+    def __chunks(self):
+        """
+        Chunks of the file with a mask of testing rows, the same in every pass
+        """
+        rng = np.random.default_rng(self.seed)
+        for chunk in pd.read_csv(self.source_filename, chunksize=self.chunk_size):
+            yield chunk, rng.random(len(chunk)) < self.test_size
+
+    def apply_binning(self, max_values: int = 5):
+        rng = np.random.default_rng(self.seed + 1)
+        attributes = [col for col in self.columns if col != self.y_name]
+        numerical = {col: True for col in attributes}
+        distinct = {col: set() for col in attributes}  # distinct training values, up to max_values + 1
+        samples = {col: np.empty(0) for col in attributes}
+        num_seen = {col: 0 for col in attributes}
+        minimum, maximum = {col: np.inf for col in attributes}, {col: -np.inf for col in attributes}
+        self.num_instances = {"train": 0, "test": 0}
+
+        for chunk, test in self.__chunks():
+            self.num_instances["test"] += int(test.sum())
+            self.num_instances["train"] += int((~test).sum())
+            train = chunk[~test]
+            for col in attributes:
+                if not numerical[col] or not (train[col].dtype == np.int64 or train[col].dtype == np.float64):
+                    numerical[col] = False
+                    continue
+                values = train[col].dropna().to_numpy(dtype=np.float64)
+                if len(distinct[col]) <= max_values:
+                    distinct[col].update(np.unique(values)[:max_values + 1].tolist())
+                if len(values) > 0:
+                    minimum[col], maximum[col] = min(minimum[col], values.min()), max(maximum[col], values.max())
+                samples[col] = self.__reservoir(samples[col], values, num_seen[col], rng)
+                num_seen[col] += len(values)
+
+        self.binning_info, self.binning_edges = {}, {}
+        logging.info("Preprocessing - binning:")
+        for col in attributes:
+            if numerical[col] and len(distinct[col]) > max_values:
+                logging.info(f"{col} - too many values")
+                sample = np.concatenate([samples[col], [minimum[col], maximum[col]]])
+                _, bins = pd.qcut(sample, q=max_values, retbins=True, duplicates='drop')
+                bins[0], bins[-1] = minimum[col], maximum[col]
+                categories = pd.cut(bins, bins=bins, precision=2, include_lowest=True).categories
+                self.binning_info[col] = {i: str(c) for i, c in enumerate(categories)}
+                self.binning_edges[col] = [float(b) for b in bins]
+            else:
+                logging.info(f"{col} - ok")
+
+    def __reservoir(self, sample: np.ndarray, values: np.ndarray, num_seen: int, rng) -> np.ndarray:
+        """
+        Reservoir sample (algorithm R) of all values seen so far, at most sample_size of them
+        """
+        free = max(0, self.sample_size - len(sample))
+        sample = np.concatenate([sample, values[:free]])
+        values = values[free:]
+        if len(values) > 0:
+            positions = np.arange(num_seen + free, num_seen + free + len(values))
+            replace = np.floor(rng.random(len(values)) * (positions + 1)).astype(np.int64)
+            keep = replace < self.sample_size
+            sample[replace[keep]] = values[keep]
+        return sample
+
+    def __bin_chunk(self, df: pd.DataFrame, include_lowest: bool) -> pd.DataFrame:
+        def bin_col(col):
+            return col, pd.cut(df[col], bins=self.binning_edges[col], include_lowest=include_lowest).cat.codes
+
+        df = df.copy()
+        with ThreadPoolExecutor(self.n_jobs) as executor:
+            for col, codes in executor.map(bin_col, self.binning_edges.keys()):
+                df[col] = codes
+        return df
+
+    def write_store(self, dirname: str) -> ColumnarStore:
+        """
+        Bin the data by the edges found by apply_binning and write them into a columnar store
+        """
+        writer = ColumnarStoreWriter(dirname, self.columns, self.num_instances)
+        for chunk, test in self.__chunks():
+            writer.append("train", self.__bin_chunk(chunk[~test], include_lowest=True))  # as qcut on the training data
+            writer.append("test", self.__bin_chunk(chunk[test], include_lowest=False))  # as cut on the testing data
+        return writer.close()
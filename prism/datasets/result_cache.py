@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from rules.rule import Rule
+
+
+class ResultCache:
+    """
+    Content-addressed cache of fitted rules and evaluation results
+
+    Entries are keyed by fingerprints of the data and of the rules they were obtained from, so a changed dataset
+    or rule set simply misses. Every entry is a JSON file in the cache directory, the most recently used entries
+    are also kept in memory, both are bounded and the least recently used entries are evicted first.
+    """
+
+    DIRNAME = ".cache"
+    MAX_MEMORY_ENTRIES = 16
+    MAX_DISK_ENTRIES = 256
+
+    _shared = {}  # dirname -> cache, datasets of one directory share their cache
+    _shared_lock = threading.Lock()
+
+    def __init__(self, dirname: str, max_memory_entries: int = MAX_MEMORY_ENTRIES,
+                 max_disk_entries: int = MAX_DISK_ENTRIES):
+        self.dirname = dirname
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()  # key -> value, least recently used first
+        self._lock = threading.Lock()  # evaluations of the GUI run in threads
+
+    @classmethod
+    def shared(cls, dirname: str) -> 'ResultCache':
+        with cls._shared_lock:
+            if dirname not in cls._shared:
+                cls._shared[dirname] = cls(dirname)
+            return cls._shared[dirname]
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return hashlib.blake2b("/".join(parts).encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def rules_fingerprint(rules: List[Rule]) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        for r in rules:
+            h.update(r.toJson().encode())
+            h.update(b"\n")
+        return h.hexdigest()
+
+    def __filename(self, key: str) -> str:
+        return f"{self.dirname}/{key}.json"
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or os.path.isfile(self.__filename(key))
+
+    def get(self, key: str):
+        """
+        Cached value, None on a miss
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                value = self._memory[key]
+            else:
+                try:
+                    with open(self.__filename(key), "r") as f:
+                        value = json.load(f)
+                except (OSError, ValueError):
+                    return None
+                self.__remember(key, value)
+            try:
+                os.utime(self.__filename(key))  # access time of the entry for the eviction from disk
+            except OSError:
+                pass
+            return value
+
+    def put(self, key: str, value):
+        with self._lock:
+            self.__remember(key, value)
+            os.makedirs(self.dirname, exist_ok=True)
+            tmp_filename = f"{self.__filename(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_filename, "w") as f:
+                f.write(json.dumps(value))
+            os.replace(tmp_filename, self.__filename(key))
+            self.__evict_disk()
+
+    def __remember(self, key: str, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def __evict_disk(self):
+        filenames = [f"{self.dirname}/{name}" for name in os.listdir(self.dirname) if name.endswith(".json")]
+        if len(filenames) <= self.max_disk_entries:
+            return
+        accessed = {}
+        for filename in filenames:
+            try:
+                accessed[filename] = os.path.getmtime(filename)
+            except FileNotFoundError:  # evicted by another process
+                pass
+        for filename in sorted(accessed, key=accessed.get)[:len(accessed) - self.max_disk_entries]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    def get_rules(self, train_fingerprint: str) -> Optional[List[Rule]]:
+        """
+        Rules fitted on training data with the fingerprint, None on a miss
+        """
+        rules = self.get(self.key("rules", train_fingerprint))
+        return [Rule(r["cl"], r["operands"]) for r in rules] if rules is not None else None
+
+    def put_rules(self, train_fingerprint: str, rules: List[Rule]):
+        self.put(self.key("rules", train_fingerprint), [json.loads(r.toJson()) for r in rules])
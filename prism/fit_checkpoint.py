@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import random
+import shutil
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from datasets.columnar_store import plain_value
+from datasets.encoded_data import EncodedData
+from rules.rule import Rule
+
+
+class FitCheckpoint:
+    """
+    State of an unfinished fit stored in a directory, so a fit on the same data can continue from it
+
+    state.json  - fingerprint of the training data, classes, fit mode (parallel or sequential), rules of completed
+                  classes, rules of the class in progress and the state of the random generator
+                  (so the resumed fit gives the same rules)
+    bits.npz    - bitmaps of the instances the class in progress still has to cover (remaining instances
+                  of the class and all instances not covered by its rules)
+
+    A checkpoint is written after every completed class and, if every_rules is set, after every every_rules rules.
+    """
+
+    VERSION = 1
+
+    def __init__(self, dirname: str, every_rules: int = None):
+        self.dirname = dirname
+        self.every_rules = every_rules
+
+    @property
+    def state_filename(self):
+        return f"{self.dirname}/state.json"
+
+    @property
+    def bits_filename(self):
+        return f"{self.dirname}/bits.npz"
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.state_filename)
+
+    @staticmethod
+    def fingerprint(data: EncodedData) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(json.dumps([data.attributes, [[plain_value(v) for v in values] for values in data.values],
+                             [plain_value(cl) for cl in data.classes]], default=str).encode())
+        for j in range(len(data.attributes)):
+            h.update(np.ascontiguousarray(data.codes[:, j]).data)
+        h.update(np.ascontiguousarray(data.y).data)
+        return h.hexdigest()
+
+    def save(self, fingerprint: str, classes: list, completed: Dict[int, List[Rule]], current: int = None,
+             current_rules: List[Rule] = (), remaining: tuple = None, seeds: list = None, parallel: bool = False):
+        """
+        completed   - rules of the completed classes by the class index
+        parallel    - the fit induces classes in parallel (with seeds of the classes), the modes break ties differently
+        current     - index of the class in progress, current_rules its rules so far
+        remaining   - bitmaps (remaining instances of the class, instances not covered by current_rules)
+        """
+        os.makedirs(self.dirname, exist_ok=True)
+        if remaining is not None:
+            with open(f"{self.bits_filename}.tmp", "wb") as f:
+                np.savez(f, cl_inst=remaining[0], inst=remaining[1])
+            os.replace(f"{self.bits_filename}.tmp", self.bits_filename)
+        state = {"version": self.VERSION, "fingerprint": fingerprint,
+                 "classes": [plain_value(cl) for cl in classes],
+                 "parallel": parallel,
+                 "completed": {str(i): [json.loads(r.toJson()) for r in rules] for i, rules in completed.items()},
+                 "current": current if remaining is not None else None,
+                 "current_rules": [json.loads(r.toJson()) for r in current_rules] if remaining is not None else [],
+                 "random_state": random.getstate(),
+                 "seeds": seeds}
+        with open(f"{self.state_filename}.tmp", "w") as f:
+            f.write(json.dumps(state))
+        os.replace(f"{self.state_filename}.tmp", self.state_filename)  # a crash while writing keeps the old state
+
+    def load(self, fingerprint: str, classes: list, parallel: bool = False) -> Optional[dict]:
+        """
+        State of the checkpoint, None if there is none or it belongs to different data or a fit in the other mode,
+        the random generator is restored to the state it had when the checkpoint was written
+        """
+        if not self.exists():
+            return None
+        with open(self.state_filename, "r") as f:
+            state = json.loads(f.read())
+        if state["version"] > self.VERSION or state["fingerprint"] != fingerprint or \
+                state["classes"] != [plain_value(cl) for cl in classes] or \
+                state.get("parallel", state["seeds"] is not None) != parallel:  # older checkpoints have only seeds
+            return None
+        state["completed"] = {int(i): [Rule(r["cl"], r["operands"]) for r in rules]
+                              for i, rules in state["completed"].items()}
+        state["current_rules"] = [Rule(r["cl"], r["operands"]) for r in state["current_rules"]]
+        state["remaining"] = None
+        if state["current"] is not None:
+            with np.load(self.bits_filename) as bits:
+                state["remaining"] = (bits["cl_inst"], bits["inst"])
+        version, internal, gauss = state["random_state"]
+        random.setstate((version, tuple(internal), gauss))
+        return state
+
+    def clear(self):
+        if os.path.isdir(self.dirname):
+            shutil.rmtree(self.dirname)
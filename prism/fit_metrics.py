@@ -0,0 +1,130 @@
+import json
+import time
+import tracemalloc
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from datasets.columnar_store import plain_value
+
+
+class RuleMetrics:
+    def __init__(self, cl, rule: str, length: int, num_candidates: int, num_rows_scanned: int, time: float,
+                 peak_memory: Optional[int] = None):
+        self.cl = cl
+        self.rule = rule
+        self.length = length  # number of operands
+        self.num_candidates = num_candidates  # candidate operands scored
+        self.num_rows_scanned = num_rows_scanned  # instances examined while scoring the candidates
+        self.time = time  # wall time [s]
+        self.peak_memory = peak_memory  # bytes, None unless tracemalloc is tracing
+
+    def to_dict(self) -> dict:
+        return {"cl": plain_value(self.cl), "rule": self.rule, "length": self.length,
+                "num_candidates": self.num_candidates, "num_rows_scanned": self.num_rows_scanned,
+                "time": self.time, "peak_memory": self.peak_memory}
+
+
+class ClassMetrics:
+    def __init__(self, cl, rules: List[RuleMetrics], time: float, peak_memory: Optional[int] = None):
+        self.cl = cl
+        self.rules = rules
+        self.time = time
+        self.peak_memory = peak_memory
+
+    @property
+    def num_candidates(self) -> int:
+        return sum(r.num_candidates for r in self.rules)
+
+    @property
+    def num_rows_scanned(self) -> int:
+        return sum(r.num_rows_scanned for r in self.rules)
+
+    def to_dict(self) -> dict:
+        return {"cl": plain_value(self.cl), "time": self.time, "peak_memory": self.peak_memory,
+                "num_rules": len(self.rules), "num_candidates": self.num_candidates,
+                "num_rows_scanned": self.num_rows_scanned, "rules": [r.to_dict() for r in self.rules]}
+
+
+class FitMetrics:
+    def __init__(self, classes: List[ClassMetrics] = None):
+        self.classes = classes if classes is not None else []
+
+    @property
+    def time(self) -> float:
+        return sum(c.time for c in self.classes)
+
+    def to_dict(self) -> dict:
+        return {"time": self.time, "classes": [c.to_dict() for c in self.classes]}
+
+    def toJson(self):
+        return json.dumps(self.to_dict())
+
+    def save(self, filename: str):
+        with open(filename, "w") as f:
+            f.write(self.toJson())
+
+
+class FitMetricsSubscriber(ABC):
+    """
+    Receives measurements of a fit, metrics are only collected while there is a subscriber
+    (peak memory only while tracemalloc is tracing)
+    """
+
+    @abstractmethod
+    def update_rule_metrics(self, metrics: RuleMetrics):
+        pass
+
+    @abstractmethod
+    def update_class_metrics(self, metrics: ClassMetrics):
+        pass
+
+
+class FitMetricsRecorder(FitMetricsSubscriber):
+    """
+    Collects metrics of the classes of a fit, subscribe it to Prism before the fit
+    """
+
+    def __init__(self):
+        self.metrics = FitMetrics()
+
+    def update_rule_metrics(self, metrics: RuleMetrics):
+        pass
+
+    def update_class_metrics(self, metrics: ClassMetrics):
+        self.metrics.classes.append(metrics)
+
+
+class FitMeter:
+    """
+    Measures rules of one class as they are induced (used by the fit only when metrics are collected)
+    """
+
+    def __init__(self, cl):
+        self.cl = cl
+        self.rules: List[RuleMetrics] = []
+        self.class_start = time.perf_counter()
+        self.start_rule()
+
+    def start_rule(self):
+        self.num_candidates = 0
+        self.num_rows_scanned = 0
+        self.rule_start = time.perf_counter()
+        if tracemalloc.is_tracing():
+            self.base_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def scored(self, num_candidates: int, num_rows_scanned: int):
+        self.num_candidates += num_candidates
+        self.num_rows_scanned += num_rows_scanned
+
+    def end_rule(self, rule) -> RuleMetrics:
+        peak = tracemalloc.get_traced_memory()[1] - self.base_memory if tracemalloc.is_tracing() else None
+        metrics = RuleMetrics(self.cl, str(rule), len(rule.operands), self.num_candidates, self.num_rows_scanned,
+                              time.perf_counter() - self.rule_start, peak)
+        self.rules.append(metrics)
+        return metrics
+
+    def end_class(self) -> ClassMetrics:
+        peaks = [r.peak_memory for r in self.rules if r.peak_memory is not None]
+        return ClassMetrics(self.cl, self.rules, time.perf_counter() - self.class_start,
+                            max(peaks) if len(peaks) > 0 else None)
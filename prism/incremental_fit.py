@@ -0,0 +1,28 @@
+import pandas as pd
+
+from datasets.dataset import Dataset
+from prism import Prism
+
+
+class IncrementalFit:
+    """
+    Adds new labelled instances to a dataset and updates its stored rules without fitting them again,
+    the work depends on the new instances and on the rules they contradict, not on the size of the dataset
+    """
+
+    def __init__(self, prism: Prism, dataset: Dataset):
+        self.prism = prism
+        self.dataset = dataset
+
+    def run(self, source_filename: str, cancel=None):
+        self.update(pd.read_csv(source_filename), cancel)
+
+    def update(self, df: pd.DataFrame, cancel=None):
+        if self.dataset.y_name not in df.columns:
+            raise ValueError(f"Target variable {self.dataset.y_name} not found in the new instances.")
+        if len(self.prism.rules) == 0 and self.dataset.rules_available:
+            self.prism.load_model(self.dataset.load_model())
+        new = self.dataset.append_train(df)
+        if self.prism.fit_incremental(self.dataset.encoded_train, new.drop(self.dataset.y_name, axis=1),
+                                      new[self.dataset.y_name], cancel):
+            self.dataset.save_rules(self.prism.rules)
@@ -1,17 +1,24 @@
 import logging
+import sys
 
+import batch_cli
 from application import Application
 from datasets.datasets_manager import DatasetsManager
-from ui.cli.cli_ui import CliUi
-from ui.simple_gui.sg_ui import SimpleGui
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] != "--cli":  # a command of the batch CLI, without interaction
+        sys.exit(batch_cli.main())
+
     logging.basicConfig(level=logging.CRITICAL)
 
-    # TODO: switch between CLI and GUI
-    # ui = CliUi()
-    ui = SimpleGui()
+    # the interface libraries are imported only for the interface in use
+    if len(sys.argv) > 1:
+        from ui.cli.cli_ui import CliUi
+        ui = CliUi()
+    else:
+        from ui.simple_gui.sg_ui import SimpleGui
+        ui = SimpleGui()
     datasets_manager = DatasetsManager()
     app = Application(ui, datasets_manager)
     app.run()
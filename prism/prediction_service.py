@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from datasets.columnar_store import plain_value
+from datasets.dataset import Dataset
+from datasets.preprocessing import DataPreprocessor
+from prism import Prism
+
+
+class ServiceMetrics:
+    """
+    Request, row and batch counters of the service, latencies of the most recent requests
+    """
+
+    LATENCY_WINDOW = 10_000
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.rows = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_rows = 0
+        self.latencies = deque(maxlen=self.LATENCY_WINDOW)  # seconds
+
+    def record_request(self, latency: float, num_rows: int):
+        self.requests += 1
+        self.rows += num_rows
+        self.latencies.append(latency)
+
+    def record_error(self):
+        self.errors += 1
+
+    def record_batch(self, size: int):
+        self.batches += 1
+        self.batched_rows += size
+
+    def to_dict(self) -> dict:
+        uptime = time.monotonic() - self.started
+        latencies = np.array(self.latencies) * 1000
+        percentiles = np.percentile(latencies, [50, 95, 99]).tolist() if len(latencies) > 0 else [0, 0, 0]
+        return {"uptime": uptime, "requests": self.requests, "rows": self.rows, "errors": self.errors,
+                "requests_per_second": self.requests / uptime if uptime > 0 else 0,
+                "rows_per_second": self.rows / uptime if uptime > 0 else 0,
+                "batches": self.batches,
+                "mean_batch_size": self.batched_rows / self.batches if self.batches > 0 else 0,
+                "latency_ms": {"p50": percentiles[0], "p95": percentiles[1], "p99": percentiles[2],
+                               "max": float(latencies.max()) if len(latencies) > 0 else 0}}
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-row predictions into batches classified at once
+
+    A batch is closed when it has max_batch_size rows or max_delay seconds after its first row,
+    rows arriving while a batch is being classified form the next one. If the batch fails, its rows are
+    classified one by one, so an invalid row fails only its own request.
+    """
+
+    def __init__(self, classify: Callable[[List[dict]], list], max_batch_size: int = 64, max_delay: float = 0.002,
+                 metrics: ServiceMetrics = None):
+        self.classify = classify
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.metrics = metrics
+        self._queue: Optional[asyncio.Queue] = None
+
+    async def predict(self, row: dict):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return await future
+
+    async def run(self):
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch_size - 1 and self.max_delay > 0:
+                await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            rows = [row for row, _ in batch]
+            try:
+                predictions = await loop.run_in_executor(None, self.classify, rows)
+            except Exception as e:
+                predictions = [e] if len(batch) == 1 else await loop.run_in_executor(None, self.__classify_each, rows)
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch))
+            for (_, future), prediction in zip(batch, predictions):
+                if future.done():  # the client may have gone away
+                    continue
+                if isinstance(prediction, Exception):
+                    future.set_exception(prediction)
+                else:
+                    future.set_result(prediction)
+
+    def __classify_each(self, rows: List[dict]) -> list:
+        """
+        Prediction of every row on its own, the exception in place of the prediction of a failed row
+        """
+        predictions = []
+        for row in rows:
+            try:
+                predictions.append(self.classify([row])[0])
+            except Exception as e:
+                predictions.append(e)
+        return predictions
+
+
+class PredictionService:
+    """
+    Local HTTP service predicting classes by rules of a dataset (asyncio, HTTP/1.1 with keep-alive)
+
+    POST /predict          {attribute: value, ...}                -> {"prediction": class}
+    POST /predict_batch    {"rows": [{attribute: value, ...}, ...]} -> {"predictions": [class, ...]}
+    GET  /metrics          counters of requests, batches, throughput and latency
+    GET  /health
+
+    Instances are given with raw values, numerical attributes are binned by the edges of the dataset.
+    Single-row requests are grouped by a MicroBatcher, the class is null if no rule matches the instance.
+    """
+
+    MAX_BODY_SIZE = 64 * 2 ** 20
+
+    def __init__(self, prism: Prism, binning_edges: dict = None, host: str = "127.0.0.1", port: int = 8000,
+                 max_batch_size: int = 64, max_delay: float = 0.002):
+        self.prism = prism
+        self.binning_edges = binning_edges if binning_edges is not None else {}
+        self.host = host
+        self.port = port
+        self.metrics = ServiceMetrics()
+        self.batcher = MicroBatcher(self.classify, max_batch_size, max_delay, self.metrics)
+        self._attributes = self.prism.compiled_rules.attributes
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._batcher_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_dataset(cls, dataset: Dataset, **kwargs) -> 'PredictionService':
+        """
+        Service with the rules of the dataset, loaded once
+        """
+        if not dataset.rules_available:
+            raise ValueError(f"Dataset {dataset.name} has no rules, fit them first.")
+        model = dataset.load_model()
+        prism = Prism()
+        prism.load_model(model)
+        return cls(prism, model.binning_edges or dataset.binning_edges, **kwargs)
+
+    def classify(self, rows: List[dict]) -> list:
+        X = pd.DataFrame.from_records(rows).reindex(columns=self._attributes)  # absent attributes are missing
+        try:
+            X = DataPreprocessor.apply_edges(X, self.binning_edges)
+        except TypeError as e:  # a value that isn't a number in a binned attribute
+            raise ValueError(f"Invalid value of a numerical attribute: {e}")
+        return [None if pd.isna(y) else plain_value(y) for y in self.prism.classify(X)]
+
+    async def start(self):
+        self._batcher_task = asyncio.create_task(self.batcher.run())
+        self._server = await asyncio.start_server(self.__handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # the chosen one if port 0 was given
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._batcher_task.cancel()
+
+    async def serve_forever(self):
+        await self.start()
+        logging.warning(f"Serving predictions on http://{self.host}:{self.port}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self.__read_request(reader)
+                if request is None:
+                    break
+                method, path, keep_alive, body = request
+                status, response = await self.__route(method, path, body)
+                self.__write_response(writer, status, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):  # closed or malformed request
+            pass
+        finally:
+            writer.close()
+
+    async def __read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        method, path, version = request_line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > self.MAX_BODY_SIZE:
+            raise ConnectionError("Request body is too large.")
+        body = await reader.readexactly(length) if length > 0 else b""
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+        return method, path, keep_alive, body
+
+    async def __route(self, method: str, path: str, body: bytes):
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok", "rules": len(self.prism.rules)}
+        if path == "/metrics" and method == "GET":
+            return 200, self.metrics.to_dict()
+        if path not in ("/predict", "/predict_batch"):
+            return 404, {"error": f"Unknown path {path}."}
+        if method != "POST":
+            return 405, {"error": f"Use POST for {path}."}
+
+        start = time.perf_counter()
+        try:
+            payload = json.loads(body)
+            if path == "/predict":
+                if not isinstance(payload, dict):
+                    raise ValueError("The instance has to be a JSON object.")
+                response, num_rows = {"prediction": await self.batcher.predict(payload)}, 1
+            else:
+                rows = payload.get("rows") if isinstance(payload, dict) else None
+                if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                    raise ValueError("The body has to be a JSON object with a list of instances under \"rows\".")
+                predictions = await asyncio.get_running_loop().run_in_executor(None, self.classify, rows) \
+                    if len(rows) > 0 else []
+                response, num_rows = {"predictions": predictions}, len(rows)
+        except ValueError as e:  # invalid JSON included
+            self.metrics.record_error()
+            return 400, {"error": str(e)}
+        except Exception as e:
+            self.metrics.record_error()
+            logging.exception("Prediction failed")
+            return 500, {"error": str(e)}
+        self.metrics.record_request(time.perf_counter() - start, num_rows)
+        return 200, response
+
+    @staticmethod
+    def __write_response(writer: asyncio.StreamWriter, status: int, response: dict, keep_alive: bool):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  500: "Internal Server Error"}[status]
+        body = json.dumps(response).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                     .encode("latin-1") + body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP service predicting classes by rules of a dataset.")
+    parser.add_argument("dataset", help="dataset directory (e.g. data/my_dataset) with fitted rules")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=64, help="rows of one micro-batch")
+    parser.add_argument("--max-delay", type=float, default=2.0,
+                        help="milliseconds a micro-batch waits for more rows")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        service = PredictionService.from_dataset(Dataset.load_metadata(args.dataset), host=args.host, port=args.port,
+                                                 max_batch_size=args.max_batch_size, max_delay=args.max_delay / 1000)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    service.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,26 @@
 import logging
+import multiprocessing
+import queue
+import random
+import threading
+import tracemalloc
 from abc import abstractmethod, ABC
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
 from datasets.dataset_eval import DatasetEval
+from datasets.coverage_index import CoverageIndex, EncodedRows
+from datasets.encoded_data import EncodedData, SharedEncodedData
+from fit_checkpoint import FitCheckpoint
+from fit_metrics import ClassMetrics, FitMeter, FitMetricsSubscriber, RuleMetrics
+from rules.approximate_scoring import ApproximateScoring
+from rules.compiled_rules import CompiledRules
+from rules.model_artifact import ModelArtifact
 from rules.rule import Rule
+from rules.rule_index import RuleIndex
 from rules.rule_eval import RuleEval
 
 
@@ -20,14 +35,29 @@ class FitProgressSubscriber(ABC):
 
 
 class FitProgressPublisher:
+    """
+    Subscribers get progress of the fit, those that are FitMetricsSubscriber also get its metrics
+    """
+
     def __init__(self):
         self.subscribers: List[FitProgressSubscriber] = []
+        self.metrics_subscribers: List[FitMetricsSubscriber] = []
 
     def subscribe(self, s: FitProgressSubscriber):
-        self.subscribers.append(s)
+        if isinstance(s, FitMetricsSubscriber):
+            self.metrics_subscribers.append(s)
+        if isinstance(s, FitProgressSubscriber) or not isinstance(s, FitMetricsSubscriber):
+            self.subscribers.append(s)
 
     def unsubscribe(self, s: FitProgressSubscriber):
-        self.subscribers.remove(s)
+        if s in self.metrics_subscribers:
+            self.metrics_subscribers.remove(s)
+        if s in self.subscribers:
+            self.subscribers.remove(s)
+
+    @property
+    def collects_metrics(self) -> bool:
+        return len(self.metrics_subscribers) > 0
 
     def notify_progress(self, state: int):
         for s in self.subscribers:
@@ -37,12 +67,128 @@ class FitProgressPublisher:
         for s in self.subscribers:
             s.update_class(class_name, class_num, num_classes, total_num_it)
 
+    def notify_rule_metrics(self, metrics: RuleMetrics):
+        for s in self.metrics_subscribers:
+            s.update_rule_metrics(metrics)
+
+    def notify_class_metrics(self, metrics: ClassMetrics):
+        for s in self.metrics_subscribers:
+            s.update_class_metrics(metrics)
+
+
+class _QueueProgressPublisher:
+    """
+    Sends progress of a fit running in a worker process to the main process
+    """
+
+    def __init__(self, queue, class_i: int, collects_metrics: bool):
+        self.queue = queue
+        self.class_i = class_i
+        self.collects_metrics = collects_metrics
+
+    def notify_progress(self, state: int):
+        self.queue.put(("progress", self.class_i, state))
+
+    def notify_new_class(self, class_name: str, class_num: int, num_classes: int, total_num_it: int):
+        self.queue.put(("class", self.class_i, class_name, class_num, num_classes, total_num_it))
+
+    def notify_rule_metrics(self, metrics: RuleMetrics):
+        self.queue.put(("rule_metrics", self.class_i, metrics))
+
+    def notify_class_metrics(self, metrics: ClassMetrics):
+        self.queue.put(("class_metrics", self.class_i, metrics))
+
+
+def _fit_class(X_y: EncodedRows, cl, i: int, num_classes: int, publisher, cancel=None,
+               kept: List[Rule] = (), regrow: List[Rule] = (), remaining: tuple = None, on_rule=None,
+               approximate: ApproximateScoring = None) -> Tuple[List[Rule], bool]:
+    """
+    Induce rules for the class cl (i-th of num_classes) by separate-and-conquer,
+    returns the rules and whether the class is complete (its rules cover all its instances)
+
+    cancel - event checked after every rule, once it is set the rules induced so far are returned
+    kept   - rules of the class that are already known to be perfect, only instances they don't cover are left
+    regrow - rules of the class that are no longer perfect, they are specialized first (and dropped if they
+             cover no remaining instance of the class)
+    remaining - bitmaps (instances of the class, instances) not covered by the kept rules, if they are known
+    on_rule - called with (rules, cl_inst, inst) after every new rule
+    approximate - sample-then-verify scoring of candidate operands (exact scoring if None)
+    """
+    rules = list(kept)
+    meter = FitMeter(cl) if publisher.collects_metrics else None
+    if remaining is not None:
+        cl_inst, inst = EncodedRows(X_y.index, remaining[0]), EncodedRows(X_y.index, remaining[1])
+    else:
+        cl_inst = X_y.of_class(cl)  # data points with the current class
+        inst = X_y
+        for rule in kept:
+            cl_inst = rule.not_matched_inst(cl_inst)
+            inst = rule.not_matched_inst(inst)
+    regrow = list(regrow)
+    publisher.notify_new_class(cl, i+1, num_classes, len(cl_inst))
+    total_cl_inst = len(cl_inst)
+    while len(cl_inst) > 0 and not (cancel is not None and cancel.is_set()):  # while there are instances of the current class that aren't covered by any rule
+        regrown = len(regrow) > 0
+        rule = Rule(cl, dict(regrow.pop(0).operands)) if regrown else Rule(cl)  # create new empty rule
+        while len(rule.available_attributes(X_y)) > 0 and not rule.is_perfect(X_y):  # while there are attributes that are not yet used in the rule and the rule incorrectly classifies any of the training data
+            scored = rule.add_operand(inst, approximate)  # add operand to the rule that has the highest precision (number of class matches)
+            if meter is not None:
+                meter.scored(*scored)
+        if regrown and len(rule.match(cl_inst)) == 0:
+            continue
+        logging.info("Final rule: %s\n", rule)
+        cl_inst = rule.not_matched_inst(cl_inst)  # remove instances of the current class that are covered by the new rule
+        inst = rule.not_matched_inst(inst)  # remove instances that are covered by the new rule
+        rules.append(rule)
+        if on_rule is not None:
+            on_rule(rules, cl_inst, inst)
+        publisher.notify_progress(total_cl_inst - len(cl_inst))
+        if meter is not None:
+            publisher.notify_rule_metrics(meter.end_rule(rule))
+            meter.start_rule()
+        logging.warning("Class: %s (%d/%d), %d remaining", cl, i+1, num_classes, len(cl_inst))
+    logging.info("Class %s completed\n", cl)
+    if meter is not None:
+        publisher.notify_class_metrics(meter.end_class())
+    return rules, len(cl_inst) == 0
+
+
+_worker_rows: Optional[EncodedRows] = None
+_worker_progress = None
+_worker_collects_metrics = False
+_worker_cancel = None
+
+
+def _init_fit_worker(spec, progress, cancel, collects_metrics: bool, trace_memory: bool):
+    global _worker_rows, _worker_progress, _worker_cancel, _worker_collects_metrics
+    _worker_rows = EncodedRows(CoverageIndex(SharedEncodedData.attach(spec)))
+    _worker_progress = progress
+    _worker_cancel = cancel
+    _worker_collects_metrics = collects_metrics
+    if trace_memory:
+        tracemalloc.start()
+
+
+def _fit_class_worker(cl, i: int, num_classes: int, seed: int, approximate: ApproximateScoring = None) -> tuple:
+    random.seed(seed)
+    try:
+        rules, complete = _fit_class(_worker_rows, cl, i, num_classes,
+                           _QueueProgressPublisher(_worker_progress, i, _worker_collects_metrics), _worker_cancel,
+                           approximate=approximate)
+    finally:
+        _worker_progress.put(("done", i))
+    for r in rules:
+        r._coverage = None  # bitmaps of the worker's index aren't sent back
+    return rules, complete, approximate  # with statistics of the class
+
 
 class Prism(FitProgressPublisher):
     def __init__(self):
         super().__init__()
         self._rules: List[Rule] = []
         self.classes = []
+        self._compiled_rules: Optional[CompiledRules] = None
+        self._rule_index: Optional[RuleIndex] = None
 
     @property
     def rules(self):
@@ -52,46 +198,225 @@ class Prism(FitProgressPublisher):
     def rules(self, value: List[Rule]):
         self._rules = value
         self.classes = list(set(r.cl for r in self._rules))
+        self._compiled_rules = None
+        self._rule_index = None
+
+    @property
+    def compiled_rules(self) -> CompiledRules:
+        if self._compiled_rules is None:
+            self._compiled_rules = CompiledRules(self._rules, self.classes)
+        return self._compiled_rules
+
+    @property
+    def rule_index(self) -> RuleIndex:
+        if self._rule_index is None:
+            self._rule_index = RuleIndex(self._rules)
+        return self._rule_index
+
+    def load_model(self, model: ModelArtifact):
+        """
+        Use rules of a stored model, its compiled form is used for classification directly
+        """
+        self.rules = model.rules
+        self._compiled_rules = model.compiled_rules
 
-    def fit(self, X: pd.DataFrame, y: pd.Series):
-        X_y = X.copy()
-        X_y['y'] = y
-        rules = []
-        classes = y.unique()  # all unique values of the target variable
+    def fit(self, X: pd.DataFrame, y: pd.Series, n_jobs: int = 1, cancel=None, checkpoint: FitCheckpoint = None,
+            approximate: ApproximateScoring = None) -> bool:
+        """
+        Returns True if the fit completed, False if it was cancelled before rules of every class covered all
+        its instances
 
+        n_jobs - number of worker processes inducing rules of different classes in parallel (1 = sequential fit)
+        cancel - event (threading.Event) to stop the fit early, the rules induced until then are kept
+        checkpoint - continue from this checkpoint if it was written for the same data, update it while fitting
+        approximate - score candidate operands on a sample first while rules cover many instances,
+                      its statistics are updated by the fit
+        """
+        # attributes and target factorized into integer codes
+        return self.fit_encoded(EncodedData.from_frame(X, y), n_jobs, classes=y.unique(), cancel=cancel,
+                                checkpoint=checkpoint, approximate=approximate)
+
+    def fit_encoded(self, data: EncodedData, n_jobs: int = 1, classes=None, cancel=None,
+                    checkpoint: FitCheckpoint = None, approximate: ApproximateScoring = None,
+                    rows: EncodedRows = None) -> bool:
+        """
+        Fit on already encoded training data (e.g. Dataset.encoded_train), returns True if the fit completed
+
+        classes - classes in the order their rules are induced, by default in order of appearance
+        rows - fit only on these instances of the data (a bitmap over a coverage index of the data, which fits
+               on other subsets can share, e.g. folds of cross-validation), sequential fit without a checkpoint
+
+        The checkpoint is kept after the fit (also a cancelled one), clear it once the rules are saved.
+        """
+        if rows is not None and (n_jobs > 1 or checkpoint is not None):
+            raise ValueError("A fit on a subset of instances is sequential and without a checkpoint.")
+        classes = list(data.classes if classes is None else classes)
+        fingerprint = checkpoint.fingerprint(data) if checkpoint is not None else None
+        parallel = n_jobs > 1 and len(classes) > 1
+        state = checkpoint.load(fingerprint, classes, parallel) if checkpoint is not None else None
+        completed: Dict[int, List[Rule]] = state["completed"] if state is not None else {}
+        if state is not None:
+            logging.warning("Fit continues from a checkpoint, %d of %d classes completed", len(completed), len(classes))
+        if parallel:
+            self.rules, fit_completed = self.__fit_parallel(data, classes, n_jobs, cancel, checkpoint, fingerprint,
+                                                            completed, state["seeds"] if state is not None else None,
+                                                            approximate)
+            return fit_completed
+        X_y = rows if rows is not None else EncodedRows(CoverageIndex(data))  # bitmaps of instances of conditions
+        rules, fit_completed = [], True
         for i, cl in enumerate(classes):
-            cl_inst = X_y[y == cl]  # data points with the current class
-            inst = X_y
-            self.notify_new_class(cl, i+1, len(classes), len(cl_inst))
-            total_cl_inst = len(cl_inst)
-            while len(cl_inst) > 0:  # while there are instances of the current class that aren't covered by any rule
-                rule = Rule(cl)  # create new empty rule
-                while len(rule.available_attributes(X_y)) > 0 and not rule.is_perfect(X_y):  # while there are attributes that are not yet used in the rule and the rule incorrectly classifies any of the training data
-                    rule.add_operand(inst)  # add operand to the rule that has the highest precision (number of class matches)
-                logging.info(f"Final rule: {rule}\n")
-                cl_inst = rule.not_matched_inst(cl_inst)  # remove instances of the current class that are covered by the new rule
-                inst = rule.not_matched_inst(inst)  # remove instances that are covered by the new rule
-                rules.append(rule)
-                self.notify_progress(total_cl_inst - len(cl_inst))
-                logging.warning(f"Class: {cl} ({i+1}/{len(classes)}), {len(cl_inst)} remaining")
-            logging.info(f"Class {cl} completed\n")
+            if cancel is not None and cancel.is_set():
+                fit_completed = False
+                break
+            if i in completed:
+                rules.extend(completed[i])
+                continue
+            kept, remaining, on_rule = [], None, None
+            if state is not None and state["current"] == i:
+                kept, remaining = state["current_rules"], state["remaining"]
+            if checkpoint is not None:
+                def on_rule(class_rules, cl_inst, inst, i=i):
+                    if (checkpoint.every_rules is not None and len(class_rules) % checkpoint.every_rules == 0) or \
+                            (cancel is not None and cancel.is_set()):
+                        checkpoint.save(fingerprint, classes, completed, i, class_rules, (cl_inst.bits, inst.bits))
+            class_rules, complete = _fit_class(X_y, cl, i, len(classes), self, cancel, kept, remaining=remaining,
+                                               on_rule=on_rule, approximate=approximate)
+            rules.extend(class_rules)
+            fit_completed = fit_completed and complete
+            if checkpoint is not None and complete:
+                completed[i] = class_rules
+                checkpoint.save(fingerprint, classes, completed)
         self.rules = rules
+        return fit_completed
+
+    def fit_incremental(self, data: EncodedData, X_new: pd.DataFrame, y_new: pd.Series, cancel=None) -> bool:
+        """
+        Update the rules after new instances (X_new, y_new) were added to the training data,
+        returns True if the update completed
+
+        data - encoded training data including the new instances
+
+        Only rules matching a new instance of another class are affected, they are specialized until they are
+        perfect again (or dropped), then rules are induced only for instances of each class the rules don't cover.
+        Rules of every class keep their order, the kept rules first.
+        """
+        rules = self.rules
+        contradicted = set()
+        if len(rules) > 0 and len(X_new) > 0:
+            matrix = self.compiled_rules.match_matrix(X_new)
+            y_codes = pd.Index(self.compiled_rules.classes, dtype=object).get_indexer(y_new.astype(object))
+            wrong = matrix & (self.compiled_rules.rule_cls[:, None] != y_codes[None, :])
+            contradicted = set(np.flatnonzero(wrong.any(axis=1)).tolist())
+        logging.info("Incremental fit: %d of %d rules contradicted by %d new instances",
+                     len(contradicted), len(rules), len(X_new))
+
+        classes = list(dict.fromkeys([r.cl for r in rules] + list(data.classes)))
+        X_y = EncodedRows(CoverageIndex(data))
+        new_rules, fit_completed = [], True
+        for i, cl in enumerate(classes):
+            if cancel is not None and cancel.is_set():
+                fit_completed = False
+                break
+            kept = [r for k, r in enumerate(rules) if r.cl == cl and k not in contradicted]
+            regrow = [r for k, r in enumerate(rules) if r.cl == cl and k in contradicted]
+            class_rules, complete = _fit_class(X_y, cl, i, len(classes), self, cancel, kept, regrow)
+            new_rules.extend(class_rules)
+            fit_completed = fit_completed and complete
+        self.rules = new_rules
+        return fit_completed
+
+    def __fit_parallel(self, data: EncodedData, classes, n_jobs: int, cancel=None, checkpoint: FitCheckpoint = None,
+                       fingerprint: str = None, completed: Dict[int, List[Rule]] = None, seeds: list = None,
+                       approximate: ApproximateScoring = None) -> Tuple[List[Rule], bool]:
+        """
+        Induce rules of every class in a separate process, the encoded data are shared through shared memory,
+        returns the rules and whether all classes are complete
+
+        With a checkpoint, classes completed before are skipped and every class is saved once it is completed
+        (a class in progress is induced again).
+        """
+        completed = {} if completed is None else completed
+        if seeds is None:
+            seeds = [random.getrandbits(64) for _ in classes]  # reproducible tie-breaking in the workers
+        todo = [i for i in range(len(classes)) if i not in completed]
+        lock = threading.Lock()
+        if checkpoint is not None:
+            checkpoint.save(fingerprint, classes, completed, seeds=seeds, parallel=True)
+
+        def class_done(i: int, future: Future):
+            if future.exception() is None and future.result()[1]:
+                with lock:
+                    completed[i] = future.result()[0]
+                    checkpoint.save(fingerprint, classes, completed, seeds=seeds, parallel=True)
+
+        progress = multiprocessing.Queue()
+        worker_cancel = multiprocessing.Event()  # cancel is set in this process, the workers see this one
+        with SharedEncodedData(data) as shared, \
+                ProcessPoolExecutor(min(n_jobs, len(classes)), initializer=_init_fit_worker,
+                                    initargs=(shared.spec, progress, worker_cancel, self.collects_metrics,
+                                              self.collects_metrics and tracemalloc.is_tracing())) as executor:
+            futures = {i: executor.submit(_fit_class_worker, classes[i], i, len(classes), seeds[i], approximate)
+                       for i in todo}
+            if checkpoint is not None:
+                for i, f in futures.items():
+                    f.add_done_callback(lambda f, i=i: class_done(i, f))
+            self.__replay_progress(progress, futures, cancel, worker_cancel)
+            class_rules, fit_completed = {}, True
+            for i, f in futures.items():
+                class_rules[i], complete, class_approximate = f.result()
+                fit_completed = fit_completed and complete
+                if approximate is not None:
+                    approximate.merge(class_approximate)
+        # merged in the order of classes
+        return [r for i in range(len(classes)) for r in (completed[i] if i in completed else class_rules[i])], \
+            fit_completed
+
+    def __replay_progress(self, progress, futures: Dict[int, Future], cancel=None, worker_cancel=None):
+        """
+        Forward progress of the workers class by class, so subscribers see the same sequence as in sequential fit
+        """
+        order = list(futures.keys())  # class indexes in the order of classes
+        pending = {i: [] for i in order}
+        current = 0
+        while current < len(order):
+            if cancel is not None and cancel.is_set():
+                worker_cancel.set()
+            try:
+                event = progress.get(timeout=0.5)
+            except queue.Empty:
+                if any(f.done() and f.exception() is not None for f in futures.values()):
+                    return  # a worker died, the error is raised when collecting the results
+                continue
+            pending[event[1]].append(event)
+            while current < len(order) and len(pending[order[current]]) > 0:
+                kind, i, *args = pending[order[current]].pop(0)
+                if kind == "class":
+                    self.notify_new_class(*args)
+                elif kind == "progress":
+                    self.notify_progress(*args)
+                elif kind == "rule_metrics":
+                    self.notify_rule_metrics(*args)
+                elif kind == "class_metrics":
+                    self.notify_class_metrics(*args)
+                else:  # class finished (or its worker failed)
+                    current += 1
+
+    def classify(self, X: pd.DataFrame, chunk_size: int = None):
+        """
+        Class of every instance by majority vote of the matching rules (None if no rule matches),
+        instances are matched in chunks of chunk_size rows to bound memory of the match matrix
+        """
+        return self.compiled_rules.classify(X, chunk_size)
+
+    def predict_one(self, row: dict):
+        """
+        Class of a single instance given as a dict attribute -> value (None if no rule matches),
+        only the rules indexed under the instance's values are evaluated
+        """
+        return self.rule_index.predict_one(row)
 
-    def classify(self, X: pd.DataFrame):
-        classes = {cl: [] for cl in self.classes}
-        y = {idx: [] for idx in X.index}
-        for r in self.rules:
-            match = r.match(X)
-            classes[r.cl].extend(match.index)
-            for idx, m in match.iterrows():
-                y[idx].append(r.cl)
-
-        def get_y(row):
-            y_list = y[row.name]
-            if len(y_list) == 0:
-                return None
-            return max(set(y[row.name]), key=y[row.name].count)
-        return X.apply(get_y, axis=1)
+    def predict(self, rows: Iterable[dict]) -> list:
+        return self.rule_index.predict(rows)
 
     def evaluate_dataset(self, X_test: pd.DataFrame, y_test: pd.Series):
         y_obt = self.classify(X_test)
@@ -103,12 +428,11 @@ class Prism(FitProgressPublisher):
 
     def evaluate_rules(self, X_train: pd.DataFrame, y_train: pd.Series) -> List[RuleEval]:
         y_val_counts = y_train.value_counts()
+        num_match, num_correct = self.compiled_rules.coverage_counts(X_train, y_train)
         results: List[RuleEval] = []
-        for rule in self.rules:
-            X_match = rule.match(X_train)
-            match = X_match.join(y_train, how='inner')
-            correct_match = match[match[y_train.name] == rule.cl]
-            coverage = len(correct_match) / y_val_counts[rule.cl] if y_val_counts[rule.cl] != 0 else 0
-            precision = (len(correct_match) / len(match)) if len(match) != 0 else 0
+        for rule, match, correct_match in zip(self.rules, num_match.tolist(), num_correct.tolist()):
+            num_cl = y_val_counts.get(rule.cl, 0)
+            coverage = correct_match / num_cl if num_cl != 0 else 0
+            precision = (correct_match / match) if match != 0 else 0
             results.append(RuleEval(precision, coverage, rule))
         return results
@@ -0,0 +1,112 @@
+import math
+from typing import List, Optional
+
+import numpy as np
+
+from datasets.coverage_index import CoverageIndex, popcount, unpack
+
+
+class ApproximateScoring:
+    """
+    Sample-then-verify scoring of candidate operands, for rules covering many instances
+
+    Candidates are scored on a random sample of the covered instances first. A candidate stays only if
+    the upper bound of its precision (Hoeffding bound, union bound over all candidates) reaches the highest
+    lower bound, precision of the remaining candidates is then counted exactly from the coverage bitmaps.
+    With probability at least confidence the best candidate stays, so the choice is the same as exact scoring.
+
+    min_rows    - rules covering fewer instances are scored exactly
+    sample_size - number of sampled instances
+    seed        - seed of the sampling (the tie-breaking of the fit is not affected)
+
+    Statistics of the choices (how often the best candidate on the sample was not the chosen one) are kept.
+    """
+
+    def __init__(self, confidence: float = 0.99, sample_size: int = 20_000, min_rows: int = 200_000,
+                 seed: Optional[int] = None):
+        if not 0 < confidence < 1:
+            raise ValueError("Confidence has to be between 0 and 1.")
+        self.confidence = confidence
+        self.sample_size = sample_size
+        self.min_rows = max(min_rows, sample_size)
+        self.rng = np.random.default_rng(seed)
+        self.num_choices = 0  # operands chosen with sampling
+        self.num_overturned = 0  # the best candidate on the sample wasn't chosen
+        self.num_candidates = 0
+        self.num_verified = 0  # candidates scored exactly
+
+    def applies(self, num_covered: int) -> bool:
+        return num_covered >= self.min_rows
+
+    def score(self, index: CoverageIndex, bits: np.ndarray, positive_bits: np.ndarray, positive: np.ndarray,
+              candidates: List[tuple]):
+        """
+        Precision and number of positive instances of the candidates, exact for those that could be the best,
+        -1 precision for the others
+
+        bits, positive_bits - instances covered by the rule, those of them belonging to the class
+        positive            - is-class of every instance (by row)
+        candidates          - (attribute index, value codes) in the order of candidates
+
+        returns (precisions, counts, sample precisions, sample counts, number of instances examined)
+        """
+        data = index.data
+        covered = np.flatnonzero(unpack(bits, index.size))
+        sample = np.sort(self.rng.choice(covered, size=min(self.sample_size, len(covered)), replace=False))
+        sample_positive = positive[sample]
+
+        sample_precisions, sample_counts, sample_totals = [], [], []
+        for j, cand in candidates:
+            att_codes = data.codes[sample, j]
+            total = np.bincount(att_codes, minlength=len(data.values[j]))[cand]
+            pos = np.bincount(att_codes[sample_positive], minlength=len(data.values[j]))[cand]
+            sample_precisions.append(np.divide(pos, total, out=np.zeros(len(cand)), where=total > 0))
+            sample_counts.append(pos)
+            sample_totals.append(total)
+        sample_precisions = np.concatenate(sample_precisions)
+        sample_counts = np.concatenate(sample_counts)
+        sample_totals = np.concatenate(sample_totals)
+
+        num_cand = len(sample_precisions)
+        delta = 1 - self.confidence
+        with np.errstate(divide='ignore'):
+            eps = np.sqrt(math.log(2 * num_cand / delta) / (2 * sample_totals))  # inf without sampled instances
+        lower = np.clip(sample_precisions - eps, 0, 1)
+        upper = np.clip(sample_precisions + eps, 0, 1)
+        survivors = upper >= lower.max()
+
+        precisions = np.full(num_cand, -1.0)
+        counts = np.zeros(num_cand, dtype=np.int64)
+        k = 0
+        for j, cand in candidates:
+            for c in np.flatnonzero(survivors[k:k + len(cand)]):
+                value_bits = index.bitmaps[j][cand[c]]
+                total = popcount(bits & value_bits)
+                counts[k + c] = popcount(positive_bits & value_bits)
+                precisions[k + c] = counts[k + c] / total if total > 0 else 0
+            k += len(cand)
+
+        num_survivors = int(survivors.sum())
+        self.num_candidates += num_cand
+        self.num_verified += num_survivors
+        return precisions, counts, sample_precisions, sample_counts, len(sample) + num_survivors * len(bits) * 64
+
+    def record(self, sample_best: int, best: int):
+        self.num_choices += 1
+        self.num_overturned += int(sample_best != best)
+
+    def merge(self, other: 'ApproximateScoring'):
+        self.num_choices += other.num_choices
+        self.num_overturned += other.num_overturned
+        self.num_candidates += other.num_candidates
+        self.num_verified += other.num_verified
+
+    @property
+    def overturn_rate(self) -> float:
+        return self.num_overturned / self.num_choices if self.num_choices > 0 else 0
+
+    def report(self) -> dict:
+        return {"confidence": self.confidence, "sample_size": self.sample_size, "min_rows": self.min_rows,
+                "num_choices": self.num_choices, "num_overturned": self.num_overturned,
+                "overturn_rate": self.overturn_rate, "num_candidates": self.num_candidates,
+                "num_verified": self.num_verified}
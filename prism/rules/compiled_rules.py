@@ -0,0 +1,123 @@
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from rules.rule import Rule
+
+
+class CompiledRules:
+    """
+    Rules with operand values encoded against a dictionary of values per attribute,
+    so a batch of instances is matched against all rules with a few vectorized comparisons
+
+    classes     - classes[c] is the class encoded by code c
+    rule_cls    - rule_cls[k] is the class code of the k-th rule
+    """
+
+    MAX_MATRIX_CELLS = 2 ** 24  # bound of the (rules x instances) match matrix of one chunk
+
+    def __init__(self, rules: List[Rule], classes: list):
+        self.rules = rules
+        self.classes = classes
+        class_index = {cl: c for c, cl in enumerate(classes)}
+        self.rule_cls = np.array([class_index[r.cl] for r in rules], dtype=np.int32)
+        self.attributes = list(dict.fromkeys(att for r in rules for att in r.operands))
+        self.values = {att: pd.Index([r.operands[att] for r in rules if att in r.operands], dtype=object).unique()
+                       for att in self.attributes}
+        # operands[k] = [(attribute, value code), ...] of the k-th rule
+        self.operands = [[(att, self.__code(att, val)) for att, val in r.operands.items()] for r in rules]
+
+    @classmethod
+    def from_encoded(cls, rules: List[Rule], classes: list, rule_cls: np.ndarray, attributes: List[str],
+                     values: List[list], operands: List[list]) -> 'CompiledRules':
+        """
+        Compiled rules from an already encoded form (e.g. a model artifact), without encoding the rules again
+
+        operands[k] = [(attribute index, value code), ...] of the k-th rule
+        """
+        compiled = cls.__new__(cls)
+        compiled.rules = rules
+        compiled.classes = classes
+        compiled.rule_cls = rule_cls
+        compiled.attributes = attributes
+        compiled.values = {att: pd.Index(v, dtype=object) for att, v in zip(attributes, values)}
+        compiled.operands = [[(attributes[a], c) for a, c in ops] for ops in operands]
+        return compiled
+
+    def __len__(self):
+        return len(self.rules)
+
+    def encode(self, X: pd.DataFrame) -> dict:
+        """
+        Codes of values of the rule attributes in X, -1 for values no rule uses
+        """
+        codes = {}
+        for att in self.attributes:
+            codes[att] = self.values[att].get_indexer(X[att].astype(object))
+            codes[att][X[att].isna().to_numpy()] = self.__code(att, np.nan)  # missing values are matched as isnull()
+        return codes
+
+    def __code(self, att: str, val) -> int:
+        if pd.isna(val):
+            missing = np.flatnonzero(self.values[att].isna())
+            return missing[0] if len(missing) > 0 else -1
+        return self.values[att].get_loc(val)
+
+    def match_matrix(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        (rules x instances) boolean matrix, [k, i] is True if the k-th rule matches the i-th instance
+        """
+        codes = self.encode(X)
+        matrix = np.ones((len(self.rules), len(X)), dtype=bool)
+        for k, operands in enumerate(self.operands):
+            for att, code in operands:
+                matrix[k] &= codes[att] == code
+        return matrix
+
+    def chunk_size(self) -> int:
+        return max(1, self.MAX_MATRIX_CELLS // max(1, len(self.rules)))
+
+    def classify(self, X: pd.DataFrame, chunk_size: int = None) -> pd.Series:
+        """
+        Majority vote of the matching rules, None for instances no rule matches (same result as Prism.classify)
+        """
+        chunk_size = self.chunk_size() if chunk_size is None else chunk_size
+        y = np.empty(len(X), dtype=object)
+        for start in range(0, len(X), chunk_size):
+            y[start:start + chunk_size] = self.vote(self.match_matrix(X.iloc[start:start + chunk_size]))
+        return pd.Series(y.tolist(), index=X.index)
+
+    def coverage_counts(self, X: pd.DataFrame, y: pd.Series, chunk_size: int = None):
+        """
+        Number of instances matched by every rule and number of them that belong to the rule's class,
+        obtained from the match matrix of each chunk reduced against the classes of the instances
+        """
+        chunk_size = self.chunk_size() if chunk_size is None else chunk_size
+        y_codes = pd.Index(self.classes, dtype=object).get_indexer(y.astype(object))
+        num_match = np.zeros(len(self.rules), dtype=np.int64)
+        num_correct = np.zeros(len(self.rules), dtype=np.int64)
+        for start in range(0, len(X), chunk_size):
+            matrix = self.match_matrix(X.iloc[start:start + chunk_size])
+            chunk_y = y_codes[start:start + chunk_size]
+            num_match += matrix.sum(axis=1)
+            for c in range(len(self.classes)):
+                rules_c = self.rule_cls == c
+                num_correct[rules_c] += matrix[rules_c][:, chunk_y == c].sum(axis=1)
+        return num_match, num_correct
+
+    def vote(self, matrix: np.ndarray) -> np.ndarray:
+        votes = np.zeros((len(self.classes), matrix.shape[1]), dtype=np.int32)
+        for c in range(len(self.classes)):
+            votes[c] = matrix[self.rule_cls == c].sum(axis=0)
+        top = votes.max(axis=0, initial=0)
+        tied = (votes == top).sum(axis=0) > 1
+        y = np.empty(matrix.shape[1], dtype=object)
+        classes = np.empty(len(self.classes), dtype=object)
+        classes[:] = self.classes
+        y[:] = classes[votes.argmax(axis=0)] if len(self.classes) > 0 else None
+        y[top == 0] = None
+        for i in np.flatnonzero(tied & (top > 0)):  # ties are broken by the set order, as the original vote did
+            y_list = [self.classes[c] for c in self.rule_cls[matrix[:, i]]]
+            y[i] = max(set(y_list), key=y_list.count)
+        return y
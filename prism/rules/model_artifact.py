@@ -0,0 +1,114 @@
+import json
+import os
+import struct
+from typing import List
+
+import numpy as np
+
+from datasets.columnar_store import plain_value
+from rules.compiled_rules import CompiledRules
+from rules.rule import Rule
+
+
+class ModelArtifact:
+    """
+    Fitted rules stored in a compact binary file
+
+    layout: magic, version (uint32), length of the header (uint64), JSON header with the value dictionary,
+    classes, binning edges, fingerprint of the training data and positions of the arrays,
+    then the arrays (8-byte aligned):
+        rule_cls    - class code of every rule
+        offsets     - operands of the k-th rule are at positions offsets[k]:offsets[k + 1]
+        op_att      - attribute index of every operand
+        op_code     - value code of every operand
+    the arrays are memory-mapped on load
+    """
+
+    MAGIC = b"PRISMMDL"
+    VERSION = 1
+    _PREFIX = struct.Struct("<8sIQ")
+
+    def __init__(self, compiled_rules: CompiledRules, binning_edges: dict = None, fingerprint: str = None):
+        """
+        fingerprint - of the training data the rules were fitted on, None if unknown (e.g. imported rules)
+        """
+        self.compiled_rules = compiled_rules
+        self.binning_edges = binning_edges if binning_edges is not None else {}
+        self.fingerprint = fingerprint
+
+    @property
+    def rules(self) -> List[Rule]:
+        return self.compiled_rules.rules
+
+    @property
+    def classes(self) -> list:
+        return self.compiled_rules.classes
+
+    @classmethod
+    def from_rules(cls, rules: List[Rule], binning_edges: dict = None, fingerprint: str = None) -> 'ModelArtifact':
+        classes = list(dict.fromkeys(r.cl for r in rules))
+        return cls(CompiledRules(rules, classes), binning_edges, fingerprint)
+
+    def save(self, filename: str):
+        compiled = self.compiled_rules
+        att_index = {att: a for a, att in enumerate(compiled.attributes)}
+        operands = [op for ops in compiled.operands for op in ops]
+        arrays = {
+            "rule_cls": np.asarray(compiled.rule_cls, dtype=np.int32),
+            "offsets": np.cumsum([0] + [len(ops) for ops in compiled.operands], dtype=np.int64),
+            "op_att": np.array([att_index[att] for att, _ in operands], dtype=np.int32),
+            "op_code": np.array([code for _, code in operands], dtype=np.int32),
+        }
+        header = {"classes": [plain_value(cl) for cl in compiled.classes],
+                  "attributes": compiled.attributes,
+                  "values": [[plain_value(v) for v in compiled.values[att]] for att in compiled.attributes],
+                  "binning_edges": self.binning_edges,
+                  "fingerprint": self.fingerprint,
+                  "arrays": {}}
+        offset = 0
+        for name, arr in arrays.items():
+            header["arrays"][name] = [arr.dtype.str, len(arr), offset]
+            offset += -(-arr.nbytes // 8) * 8
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_bytes += b" " * ((-(self._PREFIX.size + len(header_bytes))) % 8)
+
+        with open(f"{filename}.tmp", "wb") as f:
+            f.write(self._PREFIX.pack(self.MAGIC, self.VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for arr in arrays.values():
+                f.write(arr.tobytes())
+                f.write(b"\0" * ((-arr.nbytes) % 8))
+        os.replace(f"{filename}.tmp", filename)  # models loaded before keep mapping the old file
+
+    @classmethod
+    def read_header(cls, filename: str) -> dict:
+        """
+        Header of the model file, without reading the rules
+        """
+        with open(filename, "rb") as f:
+            magic, version, header_len = cls._PREFIX.unpack(f.read(cls._PREFIX.size))
+            if magic != cls.MAGIC:
+                raise ValueError(f"File {filename} isn't a model file.")
+            if version > cls.VERSION:
+                raise ValueError(f"Model file {filename} has unsupported version {version}.")
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        header["length"] = header_len
+        return header
+
+    @classmethod
+    def load(cls, filename: str) -> 'ModelArtifact':
+        header = cls.read_header(filename)
+        start = cls._PREFIX.size + header["length"]
+        arrays = {}
+        for name, (dtype, length, offset) in header["arrays"].items():
+            arrays[name] = np.memmap(filename, dtype=np.dtype(dtype), mode='r', offset=start + offset, shape=(length,)) \
+                if length > 0 else np.empty(0, dtype=np.dtype(dtype))
+
+        classes, attributes, values = header["classes"], header["attributes"], header["values"]
+        offsets, op_att, op_code = arrays["offsets"].tolist(), arrays["op_att"].tolist(), arrays["op_code"].tolist()
+        operands = [list(zip(op_att[offsets[k]:offsets[k + 1]], op_code[offsets[k]:offsets[k + 1]]))
+                    for k in range(len(offsets) - 1)]
+        rules = [Rule(classes[c], {attributes[a]: values[a][v] for a, v in ops})
+                 for c, ops in zip(arrays["rule_cls"].tolist(), operands)]
+        compiled = CompiledRules.from_encoded(rules, classes, arrays["rule_cls"], attributes, values, operands)
+        return cls(compiled, header["binning_edges"], header.get("fingerprint"))
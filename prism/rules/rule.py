@@ -1,9 +1,15 @@
+import json
 import logging
 import random
 from typing import Dict
 
+import numpy as np
 import pandas as pd
 
+from datasets.columnar_store import plain_value
+from datasets.coverage_index import CoverageIndex, EncodedRows, popcount, unpack
+from rules.approximate_scoring import ApproximateScoring
+
 
 class Rule:
     def __init__(self, cl, operands: Dict = None):
@@ -11,14 +17,19 @@ class Rule:
             operands = {}
         self.operands = operands
         self.cl = cl
+        self._coverage = None  # (index, operands, bitmap) of the last coverage() computation
 
-    def match(self, X_y: pd.DataFrame) -> pd.DataFrame:
+    def match(self, X_y):
+        if isinstance(X_y, EncodedRows):
+            return X_y.restrict(self.coverage(X_y.index))
         if len(self.operands) > 0:
             return X_y.query(self.query())
         else:
             return X_y
 
-    def class_match(self, X_y) -> pd.DataFrame:
+    def class_match(self, X_y):
+        if isinstance(X_y, EncodedRows):
+            return X_y.of_class(self.cl)
         return X_y[X_y['y'] == self.cl]
 
     def precision(self, X_y):
@@ -29,28 +40,51 @@ class Rule:
         return len(class_match) / len(match)
 
     def available_attributes(self, X_y):
-        att = list(X_y.drop('y', axis=1).columns.values) - self.operands.keys()
+        if isinstance(X_y, EncodedRows):
+            att = list(X_y.attributes) - self.operands.keys()
+        else:
+            att = list(X_y.drop('y', axis=1).columns.values) - self.operands.keys()
         return att
 
     def is_perfect(self, X_y):
         match = self.match(X_y)
-        num_mistakes = len(match[match['y'] != self.cl])
-        logging.info(f"num of matches: {len(match)}, num of mistakes: {num_mistakes}, of {len(X_y)} instances")
+        num_mistakes = len(match) - len(self.class_match(match))
+        logging.info("num of matches: %d, num of mistakes: %d, of %d instances", len(match), num_mistakes, len(X_y))
         return num_mistakes == 0
 
     def not_matched_inst(self, X_y):
+        if isinstance(X_y, EncodedRows):
+            return X_y.exclude(self.coverage(X_y.index))
         if len(self.operands) > 0:
             return X_y.query(f"not ({self.query()})")
         else:
             return X_y
 
-    def add_operand(self, X_y):
+    def add_operand(self, X_y, approximate: ApproximateScoring = None):
+        """
+        Returns the number of candidate operands scored and the number of instances examined to score them
+
+        approximate - score candidates on a sample first when the rule covers many instances (encoded data only)
+        """
+        if isinstance(X_y, EncodedRows):
+            return self.__add_best_operand(X_y, approximate)
         new_rules = self.__generate_new_rules(X_y)
         eval_rules = [(r, r.precision(X_y), len(r.class_match(r.match(X_y)))) for r in new_rules]
         sorted_rules = sorted(eval_rules, key=lambda x: (x[1], x[2], bool(random.getrandbits(1))), reverse=True)
-        eval_str = '\n'.join(f"{t[0]} : {t[1]:.2f}" for t in sorted_rules)
-        logging.info(f"Add operand [rule - precision]:\n{eval_str}")
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            eval_str = '\n'.join(f"{t[0]} : {t[1]:.2f}" for t in sorted_rules)
+            logging.info(f"Add operand [rule - precision]:\n{eval_str}")
         self.operands = sorted_rules[0][0].operands
+        self._coverage = sorted_rules[0][0]._coverage
+        return len(new_rules), len(new_rules) * len(X_y)
+
+    def coverage(self, index: CoverageIndex) -> np.ndarray:
+        """
+        Bitmap of the instances of the index covered by the rule, cached while the operands stay the same
+        """
+        if self._coverage is None or self._coverage[0] is not index or self._coverage[1] is not self.operands:
+            self._coverage = (index, self.operands, index.rule_bits(self.operands))
+        return self._coverage[2]
 
     def query(self):
         def equal(att, val):
@@ -63,12 +97,7 @@ class Rule:
         return ' & '.join(equal(att, val) for att, val in self.operands.items())
 
     def toJson(self):
-        def encode(x):
-            if type(x) is str:
-                return f'"{x}"'
-            else:
-                return str(x)
-        return '{"cl":' + encode(self.cl) + ', "operands":{' + ','.join([f'"{att}": {encode(val)}' for att, val in self.operands.items()]) + '}}'
+        return json.dumps({"cl": plain_value(self.cl), "operands": {att: plain_value(val) for att, val in self.operands.items()}})
 
     def __generate_new_rules(self, X_y):
         new_rules = []
@@ -77,6 +106,98 @@ class Rule:
                 new_rules.append(Rule(self.cl, {**self.operands, **{att: val}}))
         return new_rules
 
+    def __add_best_operand(self, X_y: EncodedRows, approximate: ApproximateScoring = None) -> tuple:
+        """
+        Same choice as add_operand, but all candidates (attribute = value) are scored at once
+        from (value x is-class) contingency tables of the instances covered by the rule
+        """
+        data = X_y.data
+        bits = X_y.bits & self.coverage(X_y.index)
+        cl_code = data.class_code(self.cl)
+        # a class absent from the data has no positive instances (y == -1 would select missing targets)
+        positive_rows = data.y == cl_code if cl_code is not None else np.zeros(len(data.y), dtype=bool)
+        # candidates in the same order as __generate_new_rules, values present in the instances in order of appearance
+        candidates = [(data.att_index[att], X_y.value_codes(att)) for att in self.available_attributes(X_y)]
+        atts = [data.attributes[j] for j, cand in candidates for _ in range(len(cand))]
+        codes = np.concatenate([cand for _, cand in candidates])
+
+        sampled = approximate is not None and approximate.applies(popcount(bits))
+        if sampled:
+            positive_bits = bits & X_y.index.class_bits(self.cl)
+            precisions, counts, sample_precisions, sample_counts, num_rows = \
+                approximate.score(X_y.index, bits, positive_bits, positive_rows, candidates)
+        rand = np.array([random.getrandbits(1) for _ in range(len(codes))])
+        log = logging.getLogger().isEnabledFor(logging.INFO)
+        if not sampled:
+            precisions, counts, num_rows = self.__score_exact(data, bits, positive_rows, candidates, rand,
+                                                              prune=not log)
+
+        # sorted(..., reverse=True) is stable, so the first candidate with the highest key wins
+        order = np.lexsort((-np.arange(len(codes)), rand, counts, precisions))[::-1]
+        if sampled:
+            approximate.record(np.lexsort((-np.arange(len(codes)), rand, sample_counts, sample_precisions))[-1],
+                               order[0])
+        if log:
+            eval_str = '\n'.join(f"{Rule(self.cl, {**self.operands, atts[i]: data.values[data.att_index[atts[i]]][codes[i]]})} : "
+                                 f"{precisions[i]:.2f}" for i in order)
+            logging.info(f"Add operand [rule - precision]:\n{eval_str}")
+        best = order[0]
+        att, j = atts[best], data.att_index[atts[best]]
+        val = data.values[j][codes[best]]
+        bits = self.coverage(X_y.index) & X_y.index.bitmaps[j][codes[best]]  # narrow the cached bitmap
+        self.operands = {**self.operands, **{att: val}}
+        self._coverage = (X_y.index, self.operands, bits)
+        return len(codes), num_rows
+
+    @staticmethod
+    def __score_exact(data, bits: np.ndarray, positive_rows: np.ndarray, candidates: list, rand: np.ndarray,
+                      prune: bool = True) -> tuple:
+        """
+        Precision and number of positive instances of the candidates, from (value x is-class) contingency tables
+
+        With prune, candidates are scored attribute by attribute (branch and bound): the number of positive instances
+        of a value is counted first (only over the positive instances), with precision at most 1 it bounds the key
+        (precision, count, random bit) of the candidate. Attributes whose candidates can't beat the best candidate so
+        far aren't counted further, once no remaining candidate can win the rest is skipped. Skipped candidates get
+        precision -1, the best candidate is the same as without pruning.
+        """
+        covered = unpack(bits, len(data))
+        covered_rows = np.flatnonzero(covered)
+        positive_covered = covered_rows[positive_rows[covered_rows]]
+        num_positive = len(positive_covered)
+        precisions = np.full(len(rand), -1.0)
+        counts = np.zeros(len(rand), dtype=np.int64)
+        best = None  # key (precision, count, random bit) of the best candidate so far
+        num_rows = 0
+        k = 0
+        for j, cand in candidates:
+            num_values = len(data.values[j])
+            cand_rand = rand[k:k + len(cand)]
+            if prune and best is not None:
+                if best[0] == 1 and best[1] == num_positive and (best[2] == 1 or not rand[k:].any()):
+                    break  # nothing left can be more precise, cover more positives or win the tie
+                pos = np.bincount(data.codes[positive_covered, j], minlength=num_values)[cand]
+                num_rows += num_positive
+                upper = (pos > 0).astype(float)  # precision bound
+                can_win = (upper > best[0]) | ((upper == best[0]) & ((pos > best[1]) |
+                                                                      ((pos == best[1]) & (cand_rand > best[2]))))
+                if not can_win.any():
+                    k += len(cand)
+                    continue
+            else:
+                pos = np.bincount(data.codes[positive_covered, j], minlength=num_values)[cand]
+            total = np.bincount(data.codes[covered_rows, j], minlength=num_values)[cand]
+            num_rows += len(covered_rows)
+            precisions[k:k + len(cand)] = np.divide(pos, total, out=np.zeros(len(cand)), where=total > 0)
+            counts[k:k + len(cand)] = pos
+            # best of the attribute, the first on ties like the final ordering
+            i = np.lexsort((-np.arange(len(cand)), cand_rand, pos, precisions[k:k + len(cand)]))[-1]
+            key = (precisions[k + i], pos[i], cand_rand[i])
+            if best is None or key > best:
+                best = key
+            k += len(cand)
+        return precisions, counts, num_rows
+
     def __str__(self):
         return ' ∧ '.join([f"{att} = {val}" for att, val in self.operands.items()]) + f"  ⇒  {self.cl}"
 
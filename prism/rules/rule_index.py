@@ -0,0 +1,63 @@
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+from rules.rule import Rule
+
+
+_MISSING = object()  # key of missing values, NaN can't be looked up in a dict
+
+
+def _key(val):
+    return _MISSING if pd.isna(val) else val
+
+
+class RuleIndex:
+    """
+    Hash index of rules for prediction of single instances
+
+    Every rule is stored under one of its conditions (attribute, value), the one shared by the fewest rules,
+    an instance then only checks the rules stored under its own values, instead of all rules
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.conditions = [{att: _key(val) for att, val in r.operands.items()} for r in rules]
+        self.unconditional = [k for k, cond in enumerate(self.conditions) if len(cond) == 0]
+        num_rules = {}  # number of rules with the condition
+        for cond in self.conditions:
+            for att_val in cond.items():
+                num_rules[att_val] = num_rules.get(att_val, 0) + 1
+        # index[attribute][value] = ids of rules stored under the condition, in the order of rules
+        self.index: Dict[str, Dict] = {}
+        for k, cond in enumerate(self.conditions):
+            if len(cond) > 0:
+                att, val = min(cond.items(), key=lambda att_val: num_rules[att_val])
+                self.index.setdefault(att, {}).setdefault(val, []).append(k)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def matching_rules(self, row: dict) -> List[int]:
+        """
+        Ids of rules matching the instance (a dict attribute -> value), in the order of rules
+        """
+        candidates = list(self.unconditional)
+        for att, by_value in self.index.items():
+            candidates.extend(by_value.get(_key(row.get(att, _MISSING)), ()))
+        if len(candidates) > len(self.unconditional):
+            candidates.sort()
+        return [k for k in candidates
+                if all(att in row and _key(row[att]) == val for att, val in self.conditions[k].items())]
+
+    def predict_one(self, row: dict):
+        """
+        Majority vote of the matching rules (same as Prism.classify), None if no rule matches
+        """
+        y_list = [self.rules[k].cl for k in self.matching_rules(row)]
+        if len(y_list) == 0:
+            return None
+        return max(set(y_list), key=y_list.count)
+
+    def predict(self, rows: Iterable[dict]) -> list:
+        return [self.predict_one(row) for row in rows]
@@ -0,0 +1,39 @@
+from typing import Optional
+
+import pandas as pd
+
+from datasets.dataset import Dataset
+from datasets.dataset_eval import DatasetEval, DatasetEvalAccumulator
+from datasets.preprocessing import DataPreprocessor
+from prism import Prism
+
+
+class StreamingClassifier:
+    """
+    Classification of a CSV file chunk by chunk, predictions are written to the output file as they are obtained,
+    so the memory use is bounded by the chunk size and not by the size of the file
+    """
+
+    PREDICTION_COLUMN = "prediction"
+
+    def __init__(self, prism: Prism, dataset: Dataset, chunk_size: int = 100_000):
+        self.prism = prism
+        self.dataset = dataset
+        self.chunk_size = chunk_size
+
+    def run(self, source_filename: str, output_filename: str) -> Optional[DatasetEval]:
+        """
+        Write predictions of instances of the source file to the output file (in the same order),
+        return metrics of the classification if the source file contains the target variable
+        """
+        evaluation = None
+        with open(output_filename, "w", newline='') as out:
+            for i, chunk in enumerate(pd.read_csv(source_filename, chunksize=self.chunk_size)):
+                X = DataPreprocessor.apply_edges(chunk, self.dataset.binning_edges or {})
+                y_obt = self.prism.classify(X.drop(self.dataset.y_name, axis=1, errors='ignore'))
+                y_obt.rename(self.PREDICTION_COLUMN).to_csv(out, header=(i == 0), index=False)
+                if self.dataset.y_name in chunk.columns:
+                    if evaluation is None:
+                        evaluation = DatasetEvalAccumulator()
+                    evaluation.update(chunk[self.dataset.y_name], y_obt)
+        return evaluation.result() if evaluation is not None else None
@@ -1,8 +1,7 @@
 from typing import List
 
-import pandas as pd
-
 from command_abs import Command
+from datasets.dataset import Dataset
 from prism import Prism
 from rules.rule import Rule
 
@@ -45,14 +44,13 @@ class EvaluateModelCliCom(Command):
     def description(self):
         return "run classification on the test dataset and show result metrics"
 
-    def __init__(self, prism: Prism, X_test: pd.DataFrame, y_test: pd.Series):
+    def __init__(self, prism: Prism, dataset: Dataset):
         super().__init__()
-        self.X_test: pd.DataFrame = X_test
-        self.y_test: pd.Series = y_test
+        self.dataset: Dataset = dataset
         self.prism: Prism = prism
 
     def run(self):
-        d_eval = self.prism.evaluate_dataset(self.X_test, self.y_test)
+        d_eval = self.dataset.evaluate_dataset(self.prism)
         print("\nModel evaluation on selected dataset:")
         print(f"Accuracy all: {d_eval.accuracy_all:.4f}\nAccuracy classified: {d_eval.accuracy_classified:.4f}")
         return True
@@ -71,14 +69,13 @@ class EvaluateRulesCliCom(Command):
     def description(self):
         return "apply each of the rules to the test dataset and get their metrics"
 
-    def __init__(self, prism: Prism, X_train: pd.DataFrame, y_train: pd.Series):
+    def __init__(self, prism: Prism, dataset: Dataset):
         super().__init__()
-        self.X_train: pd.DataFrame = X_train
-        self.y_train: pd.Series = y_train
+        self.dataset: Dataset = dataset
         self.prism: Prism = prism
 
     def run(self) -> bool:
-        rules_eval = self.prism.evaluate_rules(self.X_train, self.y_train)
+        rules_eval = self.dataset.evaluate_rules(self.prism)
         print("\nRules analysis:")
         print(f" Coverage | Precision | Rule")
         print(f"----------+-----------+-----")
@@ -2,6 +2,7 @@ from typing import Optional
 
 from prettytable import PrettyTable
 
+from background_fit import BackgroundFit
 from command_abs import CommandSelection, Command, BackCommand
 from datasets.dataset import Dataset
 from datasets.datasets_manager import DatasetsManager
@@ -26,7 +27,7 @@ class CliUi(UserInterface):
         table.field_names = ["index", "name", "# instances", "# attributes", "# targets", "rules available"]
 
         for i, d in enumerate(manager.datasets_list):
-            table.add_row([i+1, d.name, len(d.test) + len(d.train), d.num_att, d.num_targ, d.rules_available])
+            table.add_row([i+1, d.name, d.num_inst, d.num_att, d.num_targ, d.rules_available])
 
         print(self.SELECT_DATASET_TITLE)
         print(table)
@@ -53,8 +54,18 @@ class CliUi(UserInterface):
         while command.run():
             command = self.__select_command(self.RULES_ANALYSIS_TITLE, command_selection)
 
-    def fit_rules(self):
-        print(self.FIT_RULES_TEXT)
+    def fit_rules(self, fit: BackgroundFit) -> bool:
+        print(self.FIT_RULES_TEXT + " (press Ctrl+C to stop)")
+        try:
+            while not fit.forward(self, timeout=0.5):
+                pass
+        except KeyboardInterrupt:
+            fit.cancel()
+            fit.wait()
+            fit.forward(self)
+            if not fit.completed:  # Ctrl+C may come after the fit finished
+                print("\n" + self.FIT_CANCELLED_TEXT)
+        return fit.completed
 
     def update_progress(self, state: int):
         self.fit_progress_bar.update(state)
@@ -87,8 +98,8 @@ class CliUi(UserInterface):
     def __init_rules_analysis_com_sel(self, prism, dataset):
         cs = CommandSelection()
         cs.add_command(ShowRulesCliCom(prism.rules))
-        cs.add_command(EvaluateModelCliCom(prism, dataset.X_test, dataset.y_test))
-        cs.add_command(EvaluateRulesCliCom(prism, dataset.X_train, dataset.y_train))
+        cs.add_command(EvaluateModelCliCom(prism, dataset))
+        cs.add_command(EvaluateRulesCliCom(prism, dataset))
         cs.add_command(BackCommand())
         return cs
 
@@ -4,6 +4,7 @@ from typing import List, Optional, Dict
 import PySimpleGUI as sg
 import pandas as pd
 
+from background_fit import BackgroundFit
 from command_abs import CommandSelection, Command
 from datasets.dataset import Dataset
 from datasets.datasets_manager import DatasetsManager
@@ -47,7 +48,7 @@ class SimpleGui(UserInterface):
         return command_selection.commands[i]
 
     def select_dataset(self, manager: DatasetsManager) -> Optional[Dataset]:
-        datasets = [[i + 1, d.name, len(d.train) + len(d.test), d.num_att, d.num_targ, d.rules_available]
+        datasets = [[i + 1, d.name, d.num_inst, d.num_att, d.num_targ, d.rules_available]
                     for i, d in enumerate(manager.datasets)]
         self.__switch_layout([[self.h2(self.SELECT_DATASET_TITLE)],
                               [sg.Table(headings=["index", "name", "# instances", "# attributes", "# targets",
@@ -57,7 +58,7 @@ class SimpleGui(UserInterface):
                               [self.text(self.FIT_RULES_TEXT, visible=False, key="-FIT-TEXT-")],
                               [self.text(f"Class: ", visible=False, key="-CLASS-TEXT-"),
                                sg.ProgressBar(100, orientation='h', size=(10, 10), visible=False, key="-PROG-", bar_color=("#6A759B", "#BDC7F1"))],
-                              [self.button("Back", key="-BACK-")]])
+                              [self.button("Stop", visible=False, key="-STOP-"), self.button("Back", key="-BACK-")]])
 
         while True:
             event, values = self.window.read()
@@ -93,10 +94,8 @@ class SimpleGui(UserInterface):
                                         key="-TABLE-", font=(self.FONT, self.TEXT_SIZE))],
                               [self.button("Back", key="-BACK-")]])
 
-        self.window.perform_long_operation(lambda: prism.evaluate_dataset(dataset.X_test, dataset.y_test),
-                                           '-EVAL-MODEL-DONE-')
-        self.window.perform_long_operation(lambda: prism.evaluate_rules(dataset.X_train, dataset.y_train),
-                                           '-EVAL-RULES-DONE-')
+        self.window.perform_long_operation(lambda: dataset.evaluate_dataset(prism), '-EVAL-MODEL-DONE-')
+        self.window.perform_long_operation(lambda: dataset.evaluate_rules(prism), '-EVAL-RULES-DONE-')
 
         hints_window, bin_window = None, None
         rules_eval = None
@@ -160,11 +159,26 @@ class SimpleGui(UserInterface):
                                 key="-BIN-TABLE-", font=(self.FONT, self.TEXT_SIZE), justification='center')]]
         return sg.Window("Prism - Binning information", layout=layout, margins=(100, 50), finalize=True)
 
-    def fit_rules(self):
+    def fit_rules(self, fit: BackgroundFit) -> bool:
         self.window['-FIT-TEXT-'].update(visible=True)
         self.window['-CLASS-TEXT-'].update(visible=True)
         self.window['-PROG-'].update(visible=True)
         self.window['-PROG-'].expand(expand_x=True)
+        self.window['-STOP-'].update(visible=True)
+        self.window['-BACK-'].update(visible=False)
+
+        while not fit.forward(self):
+            event, values = self.window.read(timeout=int(fit.interval * 1000))
+            if event == sg.WIN_CLOSED:
+                fit.cancel()
+                fit.wait()
+                sys.exit()
+            if event == '-STOP-' and not fit.cancelled:
+                fit.cancel()
+                self.window['-FIT-TEXT-'].update("Stopping after the current rule...")
+        if fit.cancelled and not fit.completed:  # Stop may be pressed after the fit finished
+            sg.popup(self.FIT_CANCELLED_TEXT, title="Prism", font=(self.FONT, self.TEXT_SIZE))
+        return fit.completed
 
     def update_progress(self, state: int):
         self.window['-PROG-'].update(state)
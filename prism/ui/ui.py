@@ -1,5 +1,6 @@
 from abc import abstractmethod
 
+from background_fit import BackgroundFit
 from command_abs import CommandSelection, Command
 from datasets.dataset import Dataset
 from datasets.datasets_manager import DatasetsManager
@@ -13,6 +14,8 @@ class UserInterface(FitProgressSubscriber):
     SHOULD_LOAD_DATASET = "This dataset has pre-computed rules, do you want to load them?\n" \
                           "(otherwise the rules will be computed again from the dataset)"
     FIT_RULES_TEXT = "Extracting rules from the dataset..."
+    FIT_CANCELLED_TEXT = "Extraction of rules was stopped, only the rules found so far are used (they are not saved).\n" \
+                         "Next extraction of rules of this dataset continues where this one stopped."
     RULES_ANALYSIS_TITLE = "Rules analysis"
 
     @abstractmethod
@@ -32,7 +35,11 @@ class UserInterface(FitProgressSubscriber):
         pass
 
     @abstractmethod
-    def fit_rules(self):
+    def fit_rules(self, fit: BackgroundFit) -> bool:
+        """
+        Show progress of the running fit until it finishes, the user can stop it,
+        returns False if the fit was stopped before it completed (or failed)
+        """
         pass
 
     @abstractmethod
@@ -1,7 +1,9 @@
 from abc import ABC
 
+from background_fit import BackgroundFit
 from command_abs import Command
 from datasets.datasets_manager import DatasetsManager
+from fit_checkpoint import FitCheckpoint
 from prism import Prism
 from ui.ui import UserInterface
 
@@ -14,6 +16,8 @@ class WelcomePageCommand(Command, ABC):
 
 
 class ClassifierCommand(WelcomePageCommand):
+    CHECKPOINT_EVERY_RULES = 100
+
     @property
     def name(self):
         return "Classifier"
@@ -30,13 +34,19 @@ class ClassifierCommand(WelcomePageCommand):
         dataset = self.ui.select_dataset(self.d_manager)
         if dataset is None:
             return True
+        dataset.load()
         if dataset.rules_available and self.ui.should_load_rules():
-            self.prism.rules = dataset.load_rules()
+            self.prism.load_model(dataset.load_model())
         else:
-            self.ui.fit_rules()
-            self.prism.subscribe(self.ui)
-            self.prism.fit(dataset.X_train, dataset.y_train)
-            dataset.save_rules(self.prism.rules)
+            checkpoint = FitCheckpoint(dataset.checkpoint_dirname, every_rules=self.CHECKPOINT_EVERY_RULES)
+            fit = BackgroundFit(self.prism, dataset.encoded_train, checkpoint=checkpoint).start()
+            completed = self.ui.fit_rules(fit)
+            fit.result()
+            if completed:
+                dataset.save_rules(self.prism.rules)
+                checkpoint.clear()
+            elif len(self.prism.rules) == 0:
+                return True
 
         self.ui.analyse_dataset(self.prism, dataset)
         return True